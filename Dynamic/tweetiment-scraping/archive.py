@@ -0,0 +1,168 @@
+#This file keeps every ingested tweet in a local columnar archive, beyond the rows kept by the retention policy:
+#1. The rows committed to the database are also appended to Parquet files with typed columns, one directory per hour,
+#   by a background thread so that the ingestion never waits for the archive
+#2. The files of an hour are compacted into a single one once the hour is over
+#3. load_archive() only reads the hours and the columns needed for a time window, memory-mapping the files
+#
+#Layout: <root>/date=YYYY-MM-DD/hour=HH/part-*.parquet, hours of created_at in UTC
+
+import datetime
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from writer import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+#Typed columns of the archive, in the order of writer.COLUMNS
+SCHEMA = pa.schema([('tweet_id', pa.string()),
+                    ('created_at', pa.timestamp('s')),
+                    ('text', pa.string()),
+                    ('polarity', pa.float64()),
+                    ('subjectivity', pa.float64()),
+                    ('user_created_at', pa.timestamp('s')),
+                    ('user_location', pa.string()),
+                    ('user_description', pa.string()),
+                    ('user_followers_count', pa.int64()),
+                    ('longitude', pa.float64()),
+                    ('latitude', pa.float64()),
+                    ('retweet_count', pa.int64()),
+                    ('like_count', pa.int64()),
+                    ('user_state', pa.string())])
+
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_STOP = object() #marks the end of the rows in the queue
+
+def partition_dir(root, hour):
+    '''
+    Directory of the tweets created during hour (a datetime truncated to the hour, in UTC)
+    '''
+    return os.path.join(root, f"date={hour.strftime('%Y-%m-%d')}", f"hour={hour.strftime('%H')}")
+
+def _to_table(rows):
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(SCHEMA, columns):
+        if pa.types.is_timestamp(field.type):
+            arrays.append(pc.strptime(pa.array(values, pa.string()), format=_TIMESTAMP_FORMAT, unit='s'))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+def _write_table(table, directory, name):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    #Written under another name first, so that readers never see a partial file
+    pq.write_table(table, path + '.tmp', compression='snappy')
+    os.replace(path + '.tmp', path)
+
+def compact(directory):
+    '''
+    Merge the files of a partition into a single one
+    '''
+    paths = sorted(glob.glob(os.path.join(directory, 'part-*.parquet')))
+    if len(paths) < 2:
+        return
+    table = pa.concat_tables(pq.read_table(path, memory_map=True) for path in paths)
+    _write_table(table.sort_by('created_at'), directory, f'part-{time.time_ns()}-compacted.parquet')
+    for path in paths:
+        os.remove(path)
+
+class ArchiveWriter:
+    '''
+    Appends the rows committed by the BufferedWriter to the archive in root.
+
+    Pass after_commit to the BufferedWriter, it only queues the rows. A background thread
+    writes them to the hourly partitions every flush_interval seconds or flush_size rows,
+    whichever comes first, and compacts the partitions of the hours that are over. Call
+    close() to write the last rows and stop the thread.
+    '''
+    def __init__(self, root, flush_size=10000, flush_interval=60.0):
+        self.root = root
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.archived = 0
+        self._rows = []
+        self._flushed_at = time.monotonic()
+        self._open_hours = set() #partitions with files that have not been compacted yet
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='archive-writer', daemon=True)
+        self._thread.start()
+
+    def after_commit(self, rows):
+        self._queue.put(rows)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                rows = self._queue.get(timeout=max(0.0, self._flushed_at + self.flush_interval - time.monotonic()))
+            except queue.Empty:
+                self._flush()
+                continue
+            if rows is _STOP:
+                self._flush()
+                return
+            self._rows.extend(rows)
+            if len(self._rows) >= self.flush_size:
+                self._flush()
+
+    def _flush(self):
+        self._flushed_at = time.monotonic()
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        try:
+            table = _to_table(rows)
+            hours = pc.floor_temporal(table['created_at'], unit='hour')
+            name = f'part-{time.time_ns()}-{os.getpid()}.parquet'
+            for hour in pc.unique(hours).to_pylist():
+                _write_table(table.filter(pc.equal(hours, pa.scalar(hour, pa.timestamp('s')))), partition_dir(self.root, hour), name)
+                self._open_hours.add(hour)
+            self.archived += len(rows)
+            #Tweets arrive within seconds of their creation, the hours before the previous one are complete
+            current = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+            for hour in sorted(self._open_hours):
+                if hour < current - datetime.timedelta(hours=1):
+                    compact(partition_dir(self.root, hour))
+                    self._open_hours.discard(hour)
+        except Exception:
+            #The archive is a copy, a failure to write it must not stop the ingestion
+            logger.exception('Failed to archive %d rows', len(rows))
+
+def load_archive(root, start, end=None, columns=None):
+    '''
+    Tweets of the archive in root created in [start, end) (UTC, end None for up to now), as a
+    DataFrame with only columns (all of them by default). Only the files of the hours in the
+    window are opened, memory-mapped.
+    '''
+    end = end or datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    read_columns = list(columns) if columns is not None else list(COLUMNS)
+    if 'created_at' not in read_columns:
+        read_columns.append('created_at') #needed to filter the window
+    first_hour = start.replace(minute=0, second=0, microsecond=0)
+    tables = []
+    for directory in sorted(glob.glob(os.path.join(root, 'date=*', 'hour=*'))):
+        date, hour = os.path.relpath(directory, root).split(os.sep)
+        hour = datetime.datetime.strptime(f"{date[len('date='):]} {hour[len('hour='):]}", '%Y-%m-%d %H')
+        if first_hour <= hour < end:
+            for path in sorted(glob.glob(os.path.join(directory, 'part-*.parquet'))):
+                tables.append(pq.read_table(path, columns=read_columns, memory_map=True))
+    table = pa.concat_tables(tables) if tables else SCHEMA.empty_table().select(read_columns)
+    created_at = table['created_at']
+    window = pc.and_(pc.greater_equal(created_at, pa.scalar(start.replace(microsecond=0), pa.timestamp('s'))),
+                     pc.less(created_at, pa.scalar(end.replace(microsecond=0), pa.timestamp('s'))))
+    frame = table.filter(window).to_pandas()
+    return frame[list(columns)] if columns is not None else frame
@@ -0,0 +1,61 @@
+#This file checks the lexicon sentiment engine against TextBlob on the Static training data:
+#1. Scores every tweet, cleaned like the scraper does and raw, and every distinct word with both engines
+#2. Fails if any score differs by more than sentiment.TOLERANCE
+#3. Reports the tweets per second of both engines, with a cold cache
+#
+#Usage: python parity.py [--csv training.csv] [--limit N]
+
+import argparse
+import json
+import sys
+import time
+
+import pandas as pd
+
+from processing import clean_tweet_text, remove_emojis
+from replay import DEFAULT_CSV
+from sentiment import TOLERANCE, lexicon_sentiment, textblob_sentiment
+
+def compare(texts):
+    '''
+    Number of texts scored differently by the two engines, and the largest difference
+    '''
+    mismatches = 0
+    largest = 0.0
+    for text in texts:
+        difference = max(abs(a - b) for a, b in zip(lexicon_sentiment(text), textblob_sentiment(text)))
+        largest = max(largest, difference)
+        if difference > TOLERANCE:
+            mismatches += 1
+    return {'texts': len(texts), 'mismatches': mismatches, 'max_difference': largest}
+
+def throughput(scorer, texts):
+    '''
+    Texts per second scored by scorer
+    '''
+    start = time.perf_counter()
+    for text in texts:
+        scorer(text)
+    return len(texts) / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Check the lexicon sentiment engine against TextBlob')
+    arg_parser.add_argument('--csv', default=DEFAULT_CSV, help='tweets to score')
+    arg_parser.add_argument('--limit', type=int, default=None, help='only use the first N tweets')
+    args = arg_parser.parse_args()
+
+    raw = pd.read_csv(args.csv, nrows=args.limit)['text'].dropna().tolist()
+    cleaned = [clean_tweet_text(remove_emojis(text)) for text in raw]
+    words = sorted({word for text in cleaned for word in text.lower().split()})
+
+    lexicon_sentiment.cache_clear()
+    report = {'tweets_per_sec': {'textblob': throughput(textblob_sentiment, cleaned),
+                                 'lexicon': throughput(lexicon_sentiment, cleaned)}}
+    lexicon_sentiment.cache_clear()
+    report['speedup'] = report['tweets_per_sec']['lexicon'] / report['tweets_per_sec']['textblob']
+    report['cleaned'] = compare(cleaned)
+    report['raw'] = compare(raw)
+    report['words'] = compare(words)
+    print(json.dumps(report, indent=2))
+    if any(report[key]['mismatches'] for key in ('cleaned', 'raw', 'words')):
+        sys.exit(1)
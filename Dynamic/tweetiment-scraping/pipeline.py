@@ -0,0 +1,201 @@
+#This file decouples the Twitter stream from the processing of the tweets:
+#1. The stream callback only puts the raw bytes into a bounded queue
+#2. A pool of worker processes parses, cleans and scores the tweets in micro-batches
+#3. A writer stage hands the processed rows over to the database writer, in the order they were received
+
+import datetime
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from metrics import Counter, Gauge, Histogram
+from processing import STAGES, parse_batch
+
+logger = logging.getLogger(__name__)
+
+RECEIVED = Counter('scraper_tweets_received_total', 'Tweets received from the stream')
+DROPPED = Counter('scraper_tweets_dropped_total', 'Tweets dropped by the backpressure policy')
+PROCESSED = Counter('scraper_tweets_processed_total', 'Tweets parsed, cleaned and scored')
+FAILED = Counter('scraper_tweets_failed_total', 'Tweets that could not be parsed')
+PAYLOAD_ERRORS = Counter('scraper_stream_payload_errors_total', 'Error objects sent by the stream instead of a tweet', ['title'])
+QUEUE_DEPTH = Gauge('scraper_queue_depth', 'Tweets waiting to be processed')
+STAGE_SECONDS = Histogram('scraper_stage_seconds', 'Seconds spent in each stage of processing a tweet', ['stage'])
+STREAM_LAG = Histogram('scraper_stream_lag_seconds', 'Seconds between the creation of a tweet and the end of its processing',
+                       buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+
+BACKPRESSURE_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+_STOP = object() #marks the end of the stream in the queues
+
+class Pipeline:
+    '''
+    Receive -> process -> write stages connected by bounded queues.
+
+    submit() is called from the stream and never does more than queueing the raw tweet. When
+    the queue holds queue_size tweets, backpressure decides what happens: 'block' waits for
+    room (slowing down the stream), 'drop_newest' drops the submitted tweet and 'drop_oldest'
+    drops the oldest queued one. Tweets are processed in batches of up to batch_size, waiting
+    at most batch_wait seconds to fill one, by workers processes (0 to process them in a
+    thread of this process instead). sink(rows, timings) is called with every processed
+    batch, from a single thread.
+
+    Tweets that fail to parse are counted and skipped. An error of the sink (e.g. the database
+    can't be written to) stops the pipeline instead: it is kept in error, on_error(error) is
+    called so that the stream can be disconnected, and the tweets submitted from then on are
+    dropped.
+
+    The worker processes are forked when the pipeline is created, so create it before opening
+    database connections or starting threads.
+    '''
+    def __init__(self, workers=2, queue_size=10000, batch_size=50, batch_wait=0.5, backpressure='block'):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"backpressure must be one of {BACKPRESSURE_POLICIES}, not {backpressure!r}")
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.backpressure = backpressure
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        #Bounds the batches being processed, so that results don't pile up in memory either
+        self._in_flight = queue.Queue(maxsize=max(1, workers) * 2)
+        self._pool = multiprocessing.get_context('fork').Pool(workers) if workers else None
+        self._threads = []
+        self._sink = None
+        self._on_error = None
+        self.error = None #error of the sink that stopped the pipeline
+        QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    @property
+    def depth(self):
+        '''
+        Number of tweets waiting to be processed
+        '''
+        return self._queue.qsize()
+
+    def start(self, sink, on_error=None):
+        '''
+        Start the process and write stages, sending the processed batches to sink
+        '''
+        self._sink = sink
+        self._on_error = on_error
+        self._threads = [threading.Thread(target=self._dispatch, name='pipeline-dispatch', daemon=True),
+                         threading.Thread(target=self._write, name='pipeline-write', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, raw_data):
+        '''
+        Queue a raw tweet, applying the backpressure policy when the queue is full
+        '''
+        self.received += 1
+        RECEIVED.inc()
+        if self.error is not None:
+            self.dropped += 1
+            DROPPED.inc()
+            return
+        if self.backpressure == 'block':
+            self._queue.put(raw_data)
+            return
+        try:
+            self._queue.put_nowait(raw_data)
+            return
+        except queue.Full:
+            pass
+        self.dropped += 1
+        DROPPED.inc()
+        if self.backpressure == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(raw_data)
+            except queue.Full:
+                pass #the dropped tweet is counted already
+
+    def close(self):
+        '''
+        Process and write everything that was submitted, then stop the stages and the workers
+        '''
+        self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        logger.info('Pipeline closed: %d received, %d dropped, %d processed, %d failed',
+                    self.received, self.dropped, self.processed, self.failed)
+
+    def _next_batch(self):
+        #Block for the first tweet, then fill the batch for at most batch_wait seconds
+        batch = []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.batch_wait
+        while item is not _STOP:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+        return batch, item is _STOP
+
+    def _dispatch(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch()
+            if not batch:
+                continue
+            if self._pool is None:
+                result = parse_batch(batch)
+            else:
+                result = self._pool.apply_async(parse_batch, (batch,))
+            self._in_flight.put(result)
+        self._in_flight.put(_STOP)
+
+    def _write(self):
+        while True:
+            result = self._in_flight.get()
+            if result is _STOP:
+                return
+            try:
+                rows, timings, failed, errors = result if isinstance(result, tuple) else result.get()
+            except Exception:
+                #parse_batch skips the tweets it can't parse, this is a crash of the worker
+                logger.exception('Failed to process a batch of tweets')
+                continue
+            self.processed += len(rows)
+            self.failed += failed
+            self._observe(rows, timings, failed, errors)
+            if self.error is not None:
+                #Stopped, the batches still in flight are drained so that submit() doesn't block
+                self.dropped += len(rows)
+                DROPPED.inc(len(rows))
+                continue
+            try:
+                self._sink(rows, timings)
+            except Exception as error:
+                logger.exception('Failed to write a batch of tweets, stopping the pipeline')
+                self.error = error
+                if self._on_error is not None:
+                    self._on_error(error)
+
+    def _observe(self, rows, timings, failed, errors):
+        PROCESSED.inc(len(rows))
+        FAILED.inc(failed)
+        for title in errors:
+            PAYLOAD_ERRORS.labels(title).inc()
+        for stage in STAGES:
+            histogram = STAGE_SECONDS.labels(stage)
+            for tweet_timings in timings:
+                histogram.observe(tweet_timings[stage])
+        #created_at is in UTC, to the second
+        now = datetime.datetime.utcnow()
+        for row in rows:
+            STREAM_LAG.observe((now - datetime.datetime.fromisoformat(row[1])).total_seconds())
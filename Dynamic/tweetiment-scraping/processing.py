@@ -0,0 +1,119 @@
+#This file holds the processing path of a single streamed tweet, shared by scraping.py and replay.py:
+#1. Decodes the raw Twitter API v2 payload
+#2. Pre-processes the text and the user info
+#3. Scores the sentiment of the tweet
+
+import re
+import json #to convert the decoded raw tweet data string to a dictionary
+import logging
+import time
+import settings #Import the related setting constants from settings.py
+from dateutil import parser #for converting ISO 8601 date into the correct format
+from geo import resolve_state #for resolving the user location to a US state
+from sentiment import get_scorer #for scoring the sentiment with the engine selected in settings.py
+
+logger = logging.getLogger(__name__)
+
+#Stages of parse_tweet, in order, as recorded in its timings
+STAGES = ('decode', 'dates', 'cleaning', 'sentiment')
+
+score_sentiment = get_scorer(settings.SENTIMENT_ENGINE)
+
+class StreamErrors(Exception):
+    '''
+    The stream sent error objects instead of a tweet, e.g. before an operational disconnect
+    '''
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+def parse_batch(batch):
+    '''
+    Parse a micro-batch of raw tweets, e.g. in a worker process of the pipeline.
+    Return the rows, the timings of every row, the number of tweets that could not be parsed
+    and the titles of the error objects sent by the stream instead of tweets.
+    '''
+    rows = []
+    timings = []
+    failed = 0
+    errors = []
+    for raw_data in batch:
+        tweet_timings = {}
+        try:
+            rows.append(parse_tweet(raw_data, tweet_timings))
+        except StreamErrors as error:
+            errors.extend(item.get('title', 'unknown') for item in error.errors)
+            logger.warning('The stream sent errors: %s', error.errors)
+            continue
+        except Exception:
+            #A malformed tweet must not take the rest of the batch down with it
+            failed += 1
+            logger.exception('Failed to parse a tweet')
+            continue
+        timings.append(tweet_timings)
+    return rows, timings, failed, errors
+
+def parse_tweet(raw_data, timings=None):
+    '''
+    Extract info from a raw tweet and return the row to be stored in the database.
+
+    If timings is a dict, the time spent in each of STAGES (in seconds) is added to it.
+    '''
+    start = time.perf_counter()
+    #decoding the raw data which is in the form of a byte object we get a string of a dict,
+    #we then convert the string to an actual dict and store it in data
+    data = json.loads(raw_data.decode('utf-8'))
+    if 'data' not in data and 'errors' in data:
+        raise StreamErrors(data['errors'])
+    user = data['includes']['users'][0]
+    decoded = time.perf_counter()
+
+    #Creation time of the Tweet and of the user
+    created_at = parser.parse(data['data']['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+    user_created_at = parser.parse(user['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+    parsed = time.perf_counter()
+
+    #Extract the attributes from each tweet
+    tweet_id = data['data']['id'] #Tweet ID
+    text = remove_emojis(data['data']['text']) #Content of the tweet, pre-processing it
+    text = clean_tweet_text(text)
+    retweet_count = data['data']['public_metrics']['retweet_count']
+    like_count = data['data']['public_metrics']['like_count']
+    longitude = None
+    latitude = None
+    if 'coordinates' in data['data']['geo']:
+        longitude = data['data']['geo']['coordinates']['coordinates'][0]
+        latitude = data['data']['geo']['coordinates']['coordinates'][1]
+
+    #Extracting user info
+    user_location = None
+    if 'location' in user:
+        user_location = remove_emojis(user['location'])
+    user_state = resolve_state(user_location) #stored so that the dashboard only has to group by it
+    user_description = remove_emojis(user['description'])
+    user_followers_count = user['public_metrics']['followers_count']
+    cleaned = time.perf_counter()
+
+    #Retrieving the polarity and the subjectivity of the tweet
+    polarity, subjectivity = score_sentiment(text)
+    scored = time.perf_counter()
+
+    if timings is not None:
+        for stage, elapsed in zip(STAGES, (decoded - start, parsed - decoded, cleaned - parsed, scored - cleaned)):
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+    return (tweet_id, created_at, text, polarity, subjectivity, user_created_at, user_location, user_description, user_followers_count, longitude, latitude, retweet_count, like_count, user_state)
+
+#Functions used to pre-process the tweet text
+def clean_tweet_text(tweet_text):
+    '''
+    Removing links and special characters using Regex
+    '''
+    return ' '.join(re.sub("(@[A-Za-z0-9]+)|([^0-9A-Za-z \t])|(\w+:\/\/\S+)", " ", tweet_text).split())
+def remove_emojis(tweet_text):
+    '''
+    Strip all non-ASCII characters so that emojis are removed
+    '''
+    if tweet_text:
+        return tweet_text.encode('ascii', 'ignore').decode('ascii')
+    else:
+        return None
@@ -0,0 +1,209 @@
+#This file replays tweets through the scraping pipeline without a live Twitter connection:
+#1. Builds Twitter API v2 payloads from recorded tweets or from the Static training data
+#2. Feeds them through the same processing and write path as scraping.py, at a fixed rate or as fast as possible
+#3. Writes to a local SQLite database standing in for Heroku PostgreSQL
+#4. Reports the sustained throughput, per-stage latency percentiles and memory usage
+#
+#Usage: python replay.py [--input payloads.jsonl] [--csv training.csv] [--limit N] [--loops N] [--rate TWEETS_PER_SEC] [--workers N] [--archive DIR]
+#
+#With --workers the tweets go through the multi-process Pipeline of scraping.py instead of being parsed inline.
+
+import settings #Import the related setting constants from settings.py
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import resource
+import sqlite3
+import time
+import tracemalloc
+
+import pandas as pd
+
+from archive import ArchiveWriter
+from pipeline import Pipeline
+from processing import STAGES, parse_tweet
+from retention import RetentionPolicy
+from rollup import Rollup
+from writer import COLUMNS, BufferedWriter
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Static', 'training_twitter_x_y_train.csv')
+
+class SQLiteWriter(BufferedWriter):
+    '''
+    BufferedWriter for the local SQLite stand-in, which has no execute_values
+    '''
+    connection_errors = (sqlite3.ProgrammingError, sqlite3.OperationalError) #e.g. the database was closed
+
+    def _write(self, cursor, rows):
+        query = f"INSERT INTO {self.table_name} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        cursor.executemany(query, rows)
+
+def payloads_from_csv(path, limit=None):
+    '''
+    Build raw Twitter API v2 payloads (the data/includes.users shape parsed by parse_tweet)
+    from the tweets in the Static training data
+    '''
+    df = pd.read_csv(path, nrows=limit)
+    df = df.fillna({'tweet_location': '', 'name': '', 'retweet_count': 0})
+    payloads = []
+    for row in df.itertuples(index=False):
+        created_at = datetime.datetime.strptime(row.tweet_created, '%Y-%m-%d %H:%M:%S %z')
+        geo = {}
+        if isinstance(row.tweet_coord, str):
+            latitude, longitude = json.loads(row.tweet_coord)
+            geo = {'coordinates': {'type': 'Point', 'coordinates': [longitude, latitude]}}
+        user = {'id': str(row.tweet_id)[::-1],
+                'created_at': (created_at - datetime.timedelta(days=365)).isoformat(),
+                'description': f'Tweets by {row.name}',
+                'public_metrics': {'followers_count': len(row.name) * 100}}
+        if row.tweet_location:
+            user['location'] = row.tweet_location
+        data = {'data': {'id': str(row.tweet_id),
+                         'created_at': created_at.isoformat(),
+                         'text': row.text,
+                         'geo': geo,
+                         'public_metrics': {'retweet_count': int(row.retweet_count), 'like_count': 0}},
+                'includes': {'users': [user]}}
+        payloads.append(json.dumps(data).encode('utf-8'))
+    return payloads
+
+def payloads_from_file(path, limit=None):
+    '''
+    Read recorded raw payloads, one JSON document per line
+    '''
+    with open(path, 'rb') as f:
+        payloads = [line.rstrip(b'\n') for line in f if line.strip()]
+    return payloads[:limit] if limit else payloads
+
+def percentiles(values, points=(50, 95, 99)):
+    '''
+    Nearest-rank percentiles of values, in milliseconds
+    '''
+    values = sorted(values)
+    if not values:
+        return {f'p{p}': 0.0 for p in points}
+    return {f'p{p}': values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 for p in points}
+
+def replay(payloads, connection, loops=1, rate=0, trace_memory=False, workers=None, archive_dir=None):
+    '''
+    Feed payloads through parse_tweet and the buffered writer, loops times, at rate tweets
+    per second (0 for as fast as possible), and return the benchmark report.
+    If workers is not None, the payloads are submitted to a Pipeline with that many worker processes.
+    If archive_dir is not None, the tweets are also appended to the archive in that directory.
+    '''
+    pipeline = None
+    if workers is not None:
+        #Forked first, like in scraping.py
+        pipeline = Pipeline(workers=workers,
+                            queue_size=settings.PIPELINE_QUEUE_SIZE,
+                            batch_size=settings.PIPELINE_BATCH_SIZE,
+                            batch_wait=settings.PIPELINE_BATCH_WAIT,
+                            backpressure=settings.PIPELINE_BACKPRESSURE)
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {settings.TABLE_NAME} ({settings.TABLE_ATTRIBUTES})")
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {settings.ROLLUP_TABLE_NAME} ({settings.ROLLUP_TABLE_ATTRIBUTES})")
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {settings.DAILY_TABLE_NAME} ({settings.DAILY_TABLE_ATTRIBUTES})")
+    retention = RetentionPolicy(settings.TABLE_NAME,
+                                max_rows=settings.RETENTION_MAX_ROWS,
+                                max_age=None, #replayed tweets are old, only the row cap applies
+                                trim_every=settings.RETENTION_TRIM_EVERY,
+                                trim_interval=settings.RETENTION_TRIM_INTERVAL)
+    retention.ensure_index(cursor)
+    connection.commit()
+    cursor.close()
+    rollup = Rollup(settings.ROLLUP_TABLE_NAME, settings.DAILY_TABLE_NAME,
+                    bucket_seconds=settings.ROLLUP_BUCKET_SECONDS,
+                    utc_offset=datetime.timedelta(hours=settings.UTC_OFFSET_HOURS),
+                    placeholder='?')
+    after_write = [retention.after_write, rollup.after_write]
+    after_commit = []
+    archive = None
+    if archive_dir is not None:
+        archive = ArchiveWriter(archive_dir, flush_size=settings.ARCHIVE_FLUSH_SIZE, flush_interval=settings.ARCHIVE_FLUSH_INTERVAL)
+        after_commit.append(archive.after_commit)
+    writer = SQLiteWriter(connection, settings.TABLE_NAME,
+                          flush_size=settings.FLUSH_SIZE,
+                          flush_interval=settings.FLUSH_INTERVAL,
+                          after_write=after_write,
+                          after_commit=after_commit)
+
+    if trace_memory:
+        tracemalloc.start()
+    latencies = {stage: [] for stage in STAGES + ('write', 'total')}
+    if pipeline is not None:
+        def sink(rows, timings):
+            for tweet_timings in timings:
+                for stage in STAGES:
+                    latencies[stage].append(tweet_timings[stage])
+            writer.add_many(rows)
+        pipeline.start(sink)
+    count = 0
+    start = time.perf_counter()
+    for _ in range(loops):
+        for raw_data in payloads:
+            if rate:
+                #Wait for the next slot of the schedule, so that the sustained rate is respected
+                delay = start + count / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if pipeline is not None:
+                pipeline.submit(raw_data)
+                count += 1
+                continue
+            timings = {}
+            began = time.perf_counter()
+            row = parse_tweet(raw_data, timings)
+            parsed = time.perf_counter()
+            writer.add(row)
+            done = time.perf_counter()
+            for stage in STAGES:
+                latencies[stage].append(timings[stage])
+            latencies['write'].append(done - parsed)
+            latencies['total'].append(done - began)
+            count += 1
+    if pipeline is not None:
+        pipeline.close()
+    writer.close()
+    if archive is not None:
+        archive.close()
+    elapsed = time.perf_counter() - start
+
+    report = {'tweets': count,
+              'seconds': elapsed,
+              'tweets_per_sec': count / elapsed if elapsed else 0.0,
+              'latency_ms': {stage: percentiles(values) for stage, values in latencies.items() if values},
+              'flushes': writer.stats.summary(),
+              'retention_deleted': retention.deleted,
+              #ru_maxrss is in kilobytes on Linux
+              'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if pipeline is not None:
+        report['pipeline'] = {'workers': workers, 'dropped': pipeline.dropped, 'failed': pipeline.failed}
+    if archive is not None:
+        report['archived'] = archive.archived
+    if trace_memory:
+        report['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return report
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Replay tweets through the scraping pipeline and benchmark it')
+    arg_parser.add_argument('--input', help='recorded raw payloads, one JSON document per line')
+    arg_parser.add_argument('--csv', default=DEFAULT_CSV, help='tweets to build synthetic payloads from when --input is not given')
+    arg_parser.add_argument('--limit', type=int, default=None, help='only use the first N payloads')
+    arg_parser.add_argument('--loops', type=int, default=1, help='replay the payloads N times')
+    arg_parser.add_argument('--rate', type=float, default=0, help='tweets per second, 0 for as fast as possible')
+    arg_parser.add_argument('--database', default=':memory:', help='SQLite database standing in for PostgreSQL')
+    arg_parser.add_argument('--workers', type=int, default=None, help='process the tweets in a Pipeline with N worker processes (0 for a thread)')
+    arg_parser.add_argument('--archive', default=None, help='also append the tweets to a columnar archive in this directory')
+    arg_parser.add_argument('--trace-memory', action='store_true', help='also report the peak traced Python allocations (slower)')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    payloads = payloads_from_file(args.input, args.limit) if args.input else payloads_from_csv(args.csv, args.limit)
+    connection = sqlite3.connect(args.database, check_same_thread=False)
+    report = replay(payloads, connection, loops=args.loops, rate=args.rate, trace_memory=args.trace_memory, workers=args.workers, archive_dir=args.archive)
+    connection.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,72 @@
+#This file implements the retention of the tweets table:
+#1. The table is kept to a rolling window of the most recent rows and/or the most recent seconds
+#2. Trimming is amortized, it runs once every few hundred inserted rows (or seconds) instead of per tweet
+#3. The trim is an index range scan on created_at, there is no COUNT(*) over the whole table
+
+import datetime
+import logging
+import time
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+TRIM_SECONDS = Histogram('scraper_retention_trim_seconds', 'Seconds spent deleting the rows out of the retention window')
+TRIMMED_ROWS = Counter('scraper_retention_deleted_rows_total', 'Rows deleted by the retention policy')
+
+class RetentionPolicy:
+    '''
+    Keeps table_name to its most recent max_rows rows and/or to the rows created in the last
+    max_age seconds (either can be None to disable it).
+
+    The table may temporarily hold up to trim_every rows more than max_rows, in exchange the
+    ingest cost per tweet does not depend on the size of the table. Pass after_write() to the
+    BufferedWriter so that the trim runs in the same transaction as the bulk insert.
+    '''
+    def __init__(self, table_name, max_rows=None, max_age=None, trim_every=200, trim_interval=60.0):
+        self.table_name = table_name
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.trim_every = trim_every #trim once this many rows have been inserted since the last trim
+        self.trim_interval = trim_interval #or once this many seconds have passed since the last trim
+        self.deleted = 0
+        self._pending = 0
+        self._last_trim = time.monotonic()
+
+    def ensure_index(self, cursor):
+        '''
+        Create the index on created_at the trim queries rely on
+        '''
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table_name}_created_at_idx ON {self.table_name} (created_at)")
+
+    def after_write(self, cursor, rows):
+        '''
+        Called after every bulk insert, trims the table when it is due
+        '''
+        self._pending += len(rows)
+        if self._pending < self.trim_every and time.monotonic() - self._last_trim < self.trim_interval:
+            return
+        self.trim(cursor)
+
+    def trim(self, cursor):
+        '''
+        Delete the rows that fell out of the window
+        '''
+        deleted = 0
+        start = time.perf_counter()
+        if self.max_rows:
+            #created_at of the max_rows-th most recent tweet, found by walking the index backwards
+            cursor.execute(f"DELETE FROM {self.table_name} WHERE created_at < "
+                           f"(SELECT created_at FROM {self.table_name} ORDER BY created_at DESC LIMIT 1 OFFSET {int(self.max_rows) - 1})")
+            deleted += max(cursor.rowcount, 0)
+        if self.max_age:
+            #created_at is stored in UTC
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.max_age)
+            cursor.execute(f"DELETE FROM {self.table_name} WHERE created_at < '{cutoff.strftime('%Y-%m-%d %H:%M:%S')}'")
+            deleted += max(cursor.rowcount, 0)
+        TRIM_SECONDS.observe(time.perf_counter() - start)
+        TRIMMED_ROWS.inc(deleted)
+        self.deleted += deleted
+        self._pending = 0
+        self._last_trim = time.monotonic()
+        logger.debug('Retention trimmed %d rows from %s', deleted, self.table_name)
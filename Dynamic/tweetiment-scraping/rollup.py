@@ -0,0 +1,80 @@
+#This file maintains the pre-aggregated tables read by the dashboard:
+#1. 10 second buckets x polarity with the number of tweets and the sum of the followers of their authors
+#2. Daily totals of tweets and potential impressions
+#Both are upserted in the same transaction as the bulk insert of the raw tweets, and are kept
+#longer than the raw tweets. The buckets record when they were last updated, for the dashboard to
+#read the ones that changed
+
+import datetime
+import time
+from collections import defaultdict
+
+def polarity_class(polarity):
+    '''
+    Map a TextBlob polarity to -1, 0 or 1 the way storing it in the INTEGER polarity column
+    does (rounding half away from zero)
+    '''
+    if polarity >= 0.5:
+        return 1
+    if polarity <= -0.5:
+        return -1
+    return 0
+
+class Rollup:
+    '''
+    Upserts the per-bucket and the daily aggregates of every batch of written tweets.
+
+    Buckets are in UTC like created_at, days are in the local time of the dashboard
+    (utc_offset). Buckets older than max_age seconds are pruned every prune_interval seconds.
+    placeholder is the parameter style of the database driver.
+    '''
+    def __init__(self, table_name, daily_table_name, bucket_seconds=10, utc_offset=datetime.timedelta(0),
+                 max_age=None, prune_interval=3600.0, placeholder='%s'):
+        self.table_name = table_name
+        self.daily_table_name = daily_table_name
+        self.bucket_seconds = bucket_seconds
+        self.utc_offset = utc_offset
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self.placeholder = placeholder
+        self._last_prune = time.monotonic()
+
+    def after_write(self, cursor, rows):
+        '''
+        Called after every bulk insert with the written rows
+        '''
+        buckets = defaultdict(lambda: [0, 0])
+        days = defaultdict(lambda: [0, 0])
+        for row in rows:
+            #Same column order as writer.COLUMNS
+            created_at = datetime.datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S")
+            followers = row[8] or 0
+            bucket = created_at.replace(second=created_at.second - created_at.second % self.bucket_seconds)
+            aggregate = buckets[(bucket.strftime("%Y-%m-%d %H:%M:%S"), polarity_class(row[3]))]
+            aggregate[0] += 1
+            aggregate[1] += followers
+            aggregate = days[(created_at + self.utc_offset).strftime("%Y-%m-%d")]
+            aggregate[0] += 1
+            aggregate[1] += followers
+
+        #A key must appear only once per statement, hence the aggregation above
+        p = self.placeholder
+        cursor.executemany(f"INSERT INTO {self.table_name} (bucket, polarity, tweets, followers, updated_at) VALUES ({p}, {p}, {p}, {p}, CURRENT_TIMESTAMP) "
+                           f"ON CONFLICT (bucket, polarity) DO UPDATE SET tweets = {self.table_name}.tweets + EXCLUDED.tweets, "
+                           f"followers = {self.table_name}.followers + EXCLUDED.followers, updated_at = EXCLUDED.updated_at",
+                           [(bucket, polarity, tweets, followers) for (bucket, polarity), (tweets, followers) in buckets.items()])
+        cursor.executemany(f"INSERT INTO {self.daily_table_name} (day, tweets, impressions) VALUES ({p}, {p}, {p}) "
+                           f"ON CONFLICT (day) DO UPDATE SET tweets = {self.daily_table_name}.tweets + EXCLUDED.tweets, "
+                           f"impressions = {self.daily_table_name}.impressions + EXCLUDED.impressions",
+                           [(day, tweets, impressions) for day, (tweets, impressions) in days.items()])
+
+        if self.max_age and time.monotonic() - self._last_prune >= self.prune_interval:
+            self.prune(cursor)
+
+    def prune(self, cursor):
+        '''
+        Delete the buckets older than max_age, the daily totals are kept
+        '''
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.max_age)
+        cursor.execute(f"DELETE FROM {self.table_name} WHERE bucket < '{cutoff.strftime('%Y-%m-%d %H:%M:%S')}'")
+        self._last_prune = time.monotonic()
@@ -7,14 +7,21 @@ import credentials #Import the keys from credentials.py
 import settings #Import the related setting constants from settings.py 
 
 import os
+import datetime
+import logging
 import psycopg2
-import re
 import tweepy
-import mysql.connector
-import pandas as pd
-from textblob import TextBlob
-from dateutil import parser #for converting ISO 8601 date into the correct format
-import json #to convert the decoded raw tweet data string to a dictionary
+from pipeline import Pipeline #for extracting and pre-processing the info from each tweet in worker processes
+from writer import BufferedWriter #for writing the tweets to the database in bulk
+from retention import RetentionPolicy #for keeping the table to a rolling window of tweets
+from rollup import Rollup #for maintaining the aggregates shown by the dashboard
+from archive import ArchiveWriter #for keeping every tweet in a local columnar archive
+from metrics import Counter, Publisher #for publishing the metrics of the scraper, served by scraping_server.py
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+STREAM_ERRORS = Counter('scraper_stream_errors_total', 'HTTP errors (by status code), connection errors and exceptions of the stream', ['kind', 'code'])
+STREAM_DISCONNECTS = Counter('scraper_stream_disconnects_total', 'Disconnections of the stream')
 
 #Override the tweepy.StreamingClient class to add logic to on_data
 class MyStream(tweepy.StreamingClient):
@@ -24,47 +31,9 @@ class MyStream(tweepy.StreamingClient):
         '''
         Extract info from tweets
         ''' 
-        #decoding the raw data which is in the form of a byte object we get a string of a dict,
-        #we then convert the string to an actual dict and store it in data
-        data = json.loads(raw_data.decode('utf-8'))
-        #Extract the attributes from each tweet
-        tweet_id = data['data']['id'] #Tweet ID
-        created_at = parser.parse(data['data']['created_at']).strftime("%Y-%m-%d %H:%M:%S") #Creation time of the Tweet
-        text = remove_emojis(data['data']['text']) #Content of the tweet, pre-processing it  
-        text = clean_tweet_text(text)
-        retweet_count = data['data']['public_metrics']['retweet_count']
-        like_count = data['data']['public_metrics']['like_count']
-        longitude = None
-        latitude = None
-        if 'coordinates' in data['data']['geo']:
-            longitude = data['data']['geo']['coordinates']['coordinates'][0]
-            latitude = data['data']['geo']['coordinates']['coordinates'][1]
-        sentiment = TextBlob(text).sentiment #Retrieving the sentiment of the tweet
-        polarity = sentiment.polarity #Retrieving the polarity of the tweet
-        subjectivity = sentiment.subjectivity #Retrieving the sentiment of the tweet
-        
-        #Extracting user info
-        user_created_at = parser.parse(data['includes']['users'][0]['created_at']).strftime("%Y-%m-%d %H:%M:%S")
-        user_location = None
-        if 'location' in data['includes']['users'][0]:
-            user_location = remove_emojis(data['includes']['users'][0]['location'])
-        user_description = remove_emojis(data['includes']['users'][0]['description'])
-        user_followers_count = data['includes']['users'][0]['public_metrics']['followers_count']
-        
-        #print(data['data']['text'])
-        #print(f'Longitude: {longitude}, Latitude: {latitude}')
-        
-        #Storing all the data in Heroku PostgreSQL
-        cursor = connection.cursor()
-        query = f"INSERT INTO {settings.TABLE_NAME} (tweet_id, created_at, text, polarity, subjectivity, user_created_at, user_location, user_description, user_followers_count, longitude, latitude, retweet_count, like_count) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        values = (tweet_id, created_at, text, polarity, subjectivity, user_created_at, user_location, user_description, user_followers_count, longitude, latitude, retweet_count, like_count)
-        cursor.execute(query, values)
-        connection.commit()
-        
-        delete_query = f"DELETE FROM {settings.TABLE_NAME} WHERE tweet_id IN (SELECT tweet_id FROM {settings.TABLE_NAME} ORDER BY created_at asc LIMIT 200) AND (SELECT COUNT(*) FROM Facebook) > 9600;"
-        cursor.execute(delete_query)
-        connection.commit()
-        cursor.close()
+        #Only queueing the raw data here, it is parsed, cleaned and scored by the worker processes
+        #of the pipeline and written to Heroku PostgreSQL in bulk by the writer
+        pipeline.submit(raw_data)
         
 #     #This is called when includes are received.
 #     def on_includes(self, includes):
@@ -74,29 +43,44 @@ class MyStream(tweepy.StreamingClient):
 #     def on_tweet(self, tweet):
 #         pass
         
-    def on_errors(self, status_code):
+    #The error objects sent in the stream (on_errors) are counted by the pipeline, which parses the payloads
+    def on_request_error(self, status_code):
         '''
         Since the Twitter API has rate limits, we must stop scraping data once the limit 
-        has been crossed.
+        has been crossed. Other HTTP errors are retried by tweepy, with a backoff.
         '''
+        STREAM_ERRORS.labels('http', str(status_code)).inc()
+        super().on_request_error(status_code)
         if status_code == 420: #marks the end of the monthly limit rate (2M)
-            #return False to disconnect the stream
-            return False
+            #the queued and buffered tweets are written once filter() returns
+            self.disconnect()
+
+    def on_connection_error(self):
+        '''
+        Network errors and timeouts, tweepy reconnects
+        '''
+        STREAM_ERRORS.labels('connection', '').inc()
+        super().on_connection_error()
+
+    def on_exception(self, exception):
+        '''
+        Unexpected errors, the stream stops
+        '''
+        STREAM_ERRORS.labels('exception', type(exception).__name__).inc()
+        super().on_exception(exception)
+
+    def on_disconnect(self):
+        '''
+        Count the disconnections, what is still queued or buffered is written once filter() returns
+        '''
+        STREAM_DISCONNECTS.inc()
         
-#Functions used to pre-process the tweet text
-def clean_tweet_text(tweet_text): 
-    ''' 
-    Removing links and special characters using Regex
-    '''
-    return ' '.join(re.sub("(@[A-Za-z0-9]+)|([^0-9A-Za-z \t])|(\w+:\/\/\S+)", " ", tweet_text).split()) 
-def remove_emojis(tweet_text):
-    '''
-    Strip all non-ASCII characters so that emojis are removed
-    '''
-    if tweet_text:
-        return tweet_text.encode('ascii', 'ignore').decode('ascii')
-    else:
-        return None
+#The worker processes of the pipeline are forked before the database connection is opened
+pipeline = Pipeline(workers=settings.PIPELINE_WORKERS,
+                    queue_size=settings.PIPELINE_QUEUE_SIZE,
+                    batch_size=settings.PIPELINE_BATCH_SIZE,
+                    batch_wait=settings.PIPELINE_BATCH_WAIT,
+                    backpressure=settings.PIPELINE_BACKPRESSURE)
 
 DATABASE_URL = os.environ['DATABASE_URL']
 
@@ -115,19 +99,88 @@ cursor.execute("""
 if cursor.fetchone()[0] == 0:
     cursor.execute("CREATE TABLE {} ({});".format(settings.TABLE_NAME, settings.TABLE_ATTRIBUTES))
     connection.commit()
+#Tables created before the US state was resolved at ingest lack its column
+cursor.execute(f"ALTER TABLE {settings.TABLE_NAME} ADD COLUMN IF NOT EXISTS user_state VARCHAR(2)")
+#and the ones created before the dashboard read the new tweets by the time they were written lack inserted_at
+cursor.execute(f"ALTER TABLE {settings.TABLE_NAME} ADD COLUMN IF NOT EXISTS inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+cursor.execute(f"CREATE INDEX IF NOT EXISTS {settings.TABLE_NAME}_inserted_at ON {settings.TABLE_NAME} (inserted_at)")
+connection.commit()
 #Table 2
 cursor.execute("""
         SELECT COUNT(*)
         FROM information_schema.tables
         WHERE table_name = '{0}'
-        """.format(settings.TABLE_NAME_1))
+        """.format(settings.ROLLUP_TABLE_NAME))
+if cursor.fetchone()[0] == 0:
+    cursor.execute("CREATE TABLE {} ({});".format(settings.ROLLUP_TABLE_NAME, settings.ROLLUP_TABLE_ATTRIBUTES))
+    connection.commit()
+cursor.execute(f"ALTER TABLE {settings.ROLLUP_TABLE_NAME} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP")
+cursor.execute(f"CREATE INDEX IF NOT EXISTS {settings.ROLLUP_TABLE_NAME}_updated_at ON {settings.ROLLUP_TABLE_NAME} (updated_at)")
+connection.commit()
+#Table 3
+cursor.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.tables
+        WHERE table_name = '{0}'
+        """.format(settings.DAILY_TABLE_NAME))
 if cursor.fetchone()[0] == 0:
-    cursor.execute("CREATE TABLE {} ({});".format(settings.TABLE_NAME_1, settings.TABLE_ATTRIBUTES_1))
-    query = f"INSERT INTO {settings.TABLE_NAME_1} (daily_tweets_num, impressions) VALUES (0, 0)"
-    cursor.execute(query)
+    cursor.execute("CREATE TABLE {} ({});".format(settings.DAILY_TABLE_NAME, settings.DAILY_TABLE_ATTRIBUTES))
     connection.commit()
+#Table 4
+cursor.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.tables
+        WHERE table_name = '{0}'
+        """.format(settings.METRICS_TABLE_NAME))
+if cursor.fetchone()[0] == 0:
+    cursor.execute("CREATE TABLE {} ({});".format(settings.METRICS_TABLE_NAME, settings.METRICS_TABLE_ATTRIBUTES))
+    connection.commit()
+cursor.close()
+
+#Keeping only the most recent tweets in the table, the trim is amortized over several flushes
+retention = RetentionPolicy(settings.TABLE_NAME,
+                            max_rows=settings.RETENTION_MAX_ROWS,
+                            max_age=settings.RETENTION_MAX_AGE,
+                            trim_every=settings.RETENTION_TRIM_EVERY,
+                            trim_interval=settings.RETENTION_TRIM_INTERVAL)
+cursor = connection.cursor()
+retention.ensure_index(cursor)
+connection.commit()
 cursor.close()
 
+#Pre-aggregating the tweets for the dashboard as they are written
+rollup = Rollup(settings.ROLLUP_TABLE_NAME, settings.DAILY_TABLE_NAME,
+                bucket_seconds=settings.ROLLUP_BUCKET_SECONDS,
+                utc_offset=datetime.timedelta(hours=settings.UTC_OFFSET_HOURS),
+                max_age=settings.ROLLUP_MAX_AGE)
+after_write = [retention.after_write, rollup.after_write]
+after_commit = []
+
+#Archiving every tweet committed, as the retention policy deletes them from the table
+archive = None
+if settings.ARCHIVE_DIR:
+    archive = ArchiveWriter(settings.ARCHIVE_DIR,
+                            flush_size=settings.ARCHIVE_FLUSH_SIZE,
+                            flush_interval=settings.ARCHIVE_FLUSH_INTERVAL)
+    after_commit.append(archive.after_commit)
+
+#Buffering the tweets and writing them in bulk instead of one INSERT and commit per tweet
+writer = BufferedWriter(connection, settings.TABLE_NAME,
+                        flush_size=settings.FLUSH_SIZE,
+                        flush_interval=settings.FLUSH_INTERVAL,
+                        after_write=after_write,
+                        after_commit=after_commit,
+                        stats_every=settings.FLUSH_STATS_EVERY,
+                        #a new connection when Heroku drops this one, e.g. on a database restart
+                        connect=lambda: psycopg2.connect(DATABASE_URL, sslmode='require'))
+#When the tweets can't be written any more, the stream is disconnected and the worker exits below
+pipeline.start(lambda rows, timings: writer.add_many(rows), on_error=lambda error: myStream.disconnect())
+
+#Publishing the metrics on its own connection, so that a long flush doesn't delay them
+publisher = Publisher(DATABASE_URL, settings.METRICS_TABLE_NAME, 'scraper',
+                      interval=settings.METRICS_PUBLISH_INTERVAL, sslmode='require')
+publisher.start()
+
 #Authentication
 client = tweepy.Client(credentials.BEARER_TOKEN)
 
@@ -140,10 +193,19 @@ if myStream.get_rules()[0]:
 #Adding a new rule
 myStream.add_rules(tweepy.StreamRule(f"{settings.TRACK_WORDS} lang:en -is:retweet"))
 #Filtering the tweets using the rule added and using expansions to gather non-default tweet data
-myStream.filter(expansions=['author_id'], 
-                user_fields=['created_at','location','description','public_metrics'],
-                tweet_fields=['created_at','geo','public_metrics'])
-#The following part won't be reached as the streaming client won't stop automatically 
-#We need to STOP it manually
-#Closing the database
-connection.close()
\ No newline at end of file
+try:
+    myStream.filter(expansions=['author_id'], 
+                    user_fields=['created_at','location','description','public_metrics'],
+                    tweet_fields=['created_at','geo','public_metrics'])
+finally:
+    #The streaming client won't stop automatically, this is reached when it is STOPPED manually 
+    #(or crashes), so the queued and buffered tweets are written before closing the database
+    pipeline.close()
+    writer.close()
+    if archive is not None:
+        archive.close()
+    publisher.close()
+    writer.connection.close() #the writer may have replaced the connection opened above
+if pipeline.error is not None:
+    #Exit with the error, so that Heroku restarts the worker as when a write failed before the pipeline
+    raise pipeline.error
@@ -1,5 +1,27 @@
+#This file runs the web process of the scraper:
+#1. /metrics serves the metrics published by the scraper (scraping.py) in the Prometheus text format
+
 from os import environ
-from flask import Flask
+import psycopg2
+from flask import Flask, Response
+
+import settings
+from metrics import CONTENT_TYPE, read_published
 
 app = Flask(__name__)
-app.run(environ.get('PORT'))
\ No newline at end of file
+
+@app.route('/metrics')
+def metrics():
+    '''
+    The metrics the scraper published last, and the age of the publication
+    '''
+    connection = psycopg2.connect(environ['DATABASE_URL'], sslmode='require')
+    try:
+        with connection.cursor() as cursor:
+            body = read_published(cursor, settings.METRICS_TABLE_NAME)
+    finally:
+        connection.close()
+    return Response(body, content_type=CONTENT_TYPE)
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(environ.get('PORT', 5000)))
@@ -0,0 +1,104 @@
+#This file scores the sentiment of texts without building a TextBlob for every one of them:
+#1. TextBlob's English sentiment lexicon (en-sentiment.xml) is loaded once into a plain dict
+#2. Cleaned texts are split with a single str.split() and scored with the same rules as TextBlob's PatternAnalyzer
+#3. The scores are memoized, as retweets and the words of the "hot words" chart come up again and again
+#
+#Tolerance: for texts made only of ASCII letters, digits and whitespace (what clean_tweet_text produces,
+#and the words counted by the dashboard) the scores are identical to TextBlob(text).sentiment, up to
+#floating point rounding (1e-9). Any other text is handed over to TextBlob itself, so it is always exact.
+#Run tweetiment-scraping/parity.py to check this against the training data.
+#
+#The same file is shipped with the dashboard (tweetiment/sentiment.py), keep both copies identical.
+
+import re
+from functools import lru_cache
+
+from textblob import TextBlob
+from textblob.en import sentiment as _pattern_sentiment
+
+ENGINES = ('lexicon', 'textblob')
+TOLERANCE = 1e-9 #maximum difference from TextBlob of the lexicon engine
+CACHE_SIZE = 65536 #distinct texts remembered by lexicon_sentiment
+
+#Texts the lexicon engine scores itself: no punctuation, contractions, emoticons or line breaks
+#that TextBlob's tokenizer would split off or give a meaning to
+_PLAIN = re.compile(r'[0-9A-Za-z \t]*')
+
+_NEGATIONS = frozenset(_pattern_sentiment.negations)
+_MODIFIERS = _pattern_sentiment.modifiers
+
+def _load_lexicon():
+    #word -> (polarity, subjectivity, intensity, is a modifier), averaged over the parts of speech like TextBlob does
+    _pattern_sentiment.load()
+    return {word: tuple(senses[None]) + (any(tag in senses for tag in _MODIFIERS),)
+            for word, senses in dict.items(_pattern_sentiment)}
+
+LEXICON = _load_lexicon()
+
+def textblob_sentiment(text):
+    '''
+    (polarity, subjectivity) of text, from a full TextBlob
+    '''
+    polarity, subjectivity = TextBlob(text).sentiment
+    return polarity, subjectivity
+
+@lru_cache(maxsize=CACHE_SIZE)
+def lexicon_sentiment(text):
+    '''
+    (polarity, subjectivity) of text, from the preloaded lexicon
+    '''
+    if not _PLAIN.fullmatch(text):
+        return textblob_sentiment(text)
+    #Same walk as Sentiment.assessments() in textblob/_text.py, for words without part-of-speech tags:
+    #every known word is assessed, a preceding modifier ("very good") multiplies its scores by the
+    #modifier's intensity and a preceding negation ("not good") flips and halves its polarity
+    assessments = [] #[polarity, subjectivity, intensity, negated]
+    modifier = None
+    negation = None
+    for word in text.lower().split():
+        entry = LEXICON.get(word)
+        if entry is not None:
+            polarity, subjectivity, intensity, is_modifier = entry
+            if modifier is None:
+                assessments.append([polarity, subjectivity, intensity, False])
+            else:
+                last = assessments[-1]
+                last[0] = max(-1.0, min(polarity * last[2], +1.0))
+                last[1] = max(-1.0, min(subjectivity * last[2], +1.0))
+                last[2] = intensity
+            if negation is not None:
+                assessments[-1][2] = 1.0 / assessments[-1][2]
+                assessments[-1][3] = True
+            modifier = word if is_modifier else None
+            negation = word if word in _NEGATIONS else None
+        else:
+            if word in _NEGATIONS:
+                negation = word
+            elif negation and len(word) > 1:
+                negation = None #negations are only kept across small words ("not a good")
+            if negation is not None and modifier is not None and modifier.endswith('ly'):
+                assessments[-1][3] = True #"really not good"
+                negation = None
+            elif modifier and len(word) > 2:
+                modifier = None #modifiers are only kept across small words ("really is a good")
+    if not assessments:
+        return 0.0, 0.0
+    polarities = [polarity * -0.5 if negated else polarity for polarity, _, _, negated in assessments]
+    return sum(polarities) / len(assessments), sum(assessment[1] for assessment in assessments) / len(assessments)
+
+def sentiment_batch(texts, engine='lexicon'):
+    '''
+    (polarity, subjectivity) of every text
+    '''
+    scorer = get_scorer(engine)
+    return [scorer(text) for text in texts]
+
+def get_scorer(engine):
+    '''
+    Return the function scoring a text with engine, one of ENGINES
+    '''
+    if engine == 'lexicon':
+        return lexicon_sentiment
+    if engine == 'textblob':
+        return textblob_sentiment
+    raise ValueError(f"engine must be one of {ENGINES}, not {engine!r}")
@@ -1,5 +1,56 @@
 TRACK_WORDS = "facebook"
 TABLE_NAME = "facebook"
-TABLE_ATTRIBUTES = "tweet_id VARCHAR(255), created_at TIMESTAMP, text VARCHAR(1000), polarity INTEGER, subjectivity INTEGER, user_created_at TIMESTAMP, user_location VARCHAR(255), user_description VARCHAR(255), user_followers_count INTEGER, longitude DOUBLE PRECISION, latitude DOUBLE PRECISION, retweet_count INTEGER, like_count INTEGER"
-TABLE_NAME_1 = "summary"
-TABLE_ATTRIBUTES_1 = "daily_tweets_num BIGINT, impressions BIGINT"
\ No newline at end of file
+TABLE_ATTRIBUTES = "tweet_id VARCHAR(255), created_at TIMESTAMP, text VARCHAR(1000), polarity INTEGER, subjectivity INTEGER, user_created_at TIMESTAMP, user_location VARCHAR(255), user_description VARCHAR(255), user_followers_count INTEGER, longitude DOUBLE PRECISION, latitude DOUBLE PRECISION, retweet_count INTEGER, like_count INTEGER, user_state VARCHAR(2), inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+UTC_OFFSET_HOURS = -7 #the dashboard shows times and days in PDT (Pacific Daylight Time)
+
+#Rollups maintained at ingest: the number of tweets and the sum of the followers of their authors 
+#per ROLLUP_BUCKET_SECONDS bucket and polarity (kept for ROLLUP_MAX_AGE seconds), and per day.
+#inserted_at and updated_at are set by the database (in UTC on Heroku) when the rows are written, the
+#dashboard reads the new rows by them as the rows of a backlog are committed long after their created_at
+ROLLUP_TABLE_NAME = "sentiment_rollup"
+ROLLUP_TABLE_ATTRIBUTES = "bucket TIMESTAMP, polarity SMALLINT, tweets INTEGER, followers BIGINT, updated_at TIMESTAMP, PRIMARY KEY (bucket, polarity)"
+DAILY_TABLE_NAME = "daily_rollup"
+DAILY_TABLE_ATTRIBUTES = "day DATE PRIMARY KEY, tweets BIGINT, impressions BIGINT"
+ROLLUP_BUCKET_SECONDS = 10
+ROLLUP_MAX_AGE = 30 * 24 * 3600
+
+#Buffered writes: the buffered tweets are flushed to the database once FLUSH_SIZE of them 
+#have been collected or the oldest one has waited FLUSH_INTERVAL seconds
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+FLUSH_STATS_EVERY = 50 #log flush sizes and latencies every n flushes, 0 to disable
+
+#Retention: the table keeps the RETENTION_MAX_ROWS most recent tweets and/or the tweets from 
+#the last RETENTION_MAX_AGE seconds (None to disable either). The trim runs once 
+#RETENTION_TRIM_EVERY tweets have been inserted or RETENTION_TRIM_INTERVAL seconds have passed
+RETENTION_MAX_ROWS = 9600
+RETENTION_MAX_AGE = None
+RETENTION_TRIM_EVERY = 200
+RETENTION_TRIM_INTERVAL = 60.0
+
+#Pipeline: the stream only queues the raw tweets (at most PIPELINE_QUEUE_SIZE of them), which are 
+#processed by PIPELINE_WORKERS processes (0 for a thread of the scraper) in batches of up to 
+#PIPELINE_BATCH_SIZE, waiting at most PIPELINE_BATCH_WAIT seconds to fill a batch. 
+#PIPELINE_BACKPRESSURE is what happens when the queue is full: 'block', 'drop_newest' or 'drop_oldest'
+PIPELINE_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 10000
+PIPELINE_BATCH_SIZE = 50
+PIPELINE_BATCH_WAIT = 0.5
+PIPELINE_BACKPRESSURE = 'block'
+
+#Sentiment engine: 'lexicon' scores the cleaned tweets with TextBlob's lexicon loaded once (same scores,
+#see sentiment.py for the tolerance), 'textblob' builds a TextBlob for every tweet
+SENTIMENT_ENGINE = 'lexicon'
+
+#Archive: every tweet committed is also appended to Parquet files partitioned by hour in ARCHIVE_DIR
+#(None to disable it), every ARCHIVE_FLUSH_INTERVAL seconds or ARCHIVE_FLUSH_SIZE tweets. Heroku's
+#filesystem is wiped when the dyno restarts, point it to persistent storage to keep days of history
+ARCHIVE_DIR = "archive"
+ARCHIVE_FLUSH_SIZE = 10000
+ARCHIVE_FLUSH_INTERVAL = 60.0
+
+#Metrics: the scraper has no HTTP port on Heroku, so it writes its metrics to METRICS_TABLE_NAME every
+#METRICS_PUBLISH_INTERVAL seconds and the web process (scraping_server.py) serves them on /metrics
+METRICS_TABLE_NAME = "scraper_metrics"
+METRICS_TABLE_ATTRIBUTES = "source VARCHAR(64) PRIMARY KEY, body TEXT, updated_at TIMESTAMP"
+METRICS_PUBLISH_INTERVAL = 15.0
@@ -0,0 +1,252 @@
+#This file implements the buffered write path used by scraping.py:
+#1. Parsed tweets are collected in memory instead of being inserted one at a time
+#2. The buffer is flushed with a single multi-row INSERT once it is big enough or old enough
+#3. Flush sizes and latencies are tracked so the thresholds can be tuned
+#4. A failed flush keeps its rows for the next one, on a new connection if the database dropped the current one
+#5. A row rejected by the database only costs that row, the others of its flush are written one at a time
+
+import logging
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = Histogram('scraper_flush_seconds', 'Seconds spent in each step of a flush to the database', ['step'])
+FLUSHED_ROWS = Counter('scraper_flushed_rows_total', 'Rows written to the database')
+FLUSH_FAILURES = Counter('scraper_flush_failures_total', 'Flushes rolled back after an error')
+
+#Columns of settings.TABLE_NAME in the order the rows are buffered
+COLUMNS = ('tweet_id', 'created_at', 'text', 'polarity', 'subjectivity', 'user_created_at', 'user_location',
+           'user_description', 'user_followers_count', 'longitude', 'latitude', 'retweet_count', 'like_count', 'user_state')
+
+class FlushStats:
+    '''
+    Running statistics about the flushes done by a BufferedWriter
+    '''
+    def __init__(self):
+        self.flushes = 0
+        self.rows = 0
+        self.failures = 0
+        self.dropped = 0 #rows of the failed flushes that were not kept
+        self.max_size = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, size, latency):
+        self.flushes += 1
+        self.rows += size
+        self.max_size = max(self.max_size, size)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def summary(self):
+        '''
+        Return the statistics as a dict, e.g. for logging
+        '''
+        flushes = self.flushes or 1
+        return {'flushes': self.flushes,
+                'rows': self.rows,
+                'failures': self.failures,
+                'dropped': self.dropped,
+                'avg_size': self.rows / flushes,
+                'max_size': self.max_size,
+                'avg_latency_ms': self.total_latency / flushes * 1000,
+                'max_latency_ms': self.max_latency * 1000}
+
+class BufferedWriter:
+    '''
+    Collects rows in memory and writes them to the database in bulk.
+
+    The buffer is flushed when it holds flush_size rows or when its oldest row is older than
+    flush_interval seconds, whichever happens first. A background thread takes care of the
+    age threshold so that rows don't sit in memory when the stream goes quiet. Call close()
+    on shutdown so that whatever is still buffered gets written.
+
+    Every callable of after_write is called with the cursor and the written rows after every
+    bulk insert and runs in the same transaction, e.g. for the retention trim and the rollups.
+    Every callable of after_commit is called with the rows once they are committed, e.g. to
+    hand them over to the archive; it must not block.
+
+    When the connection was lost (one of connection_errors, or the rollback failed) the error is
+    raised and the rows are put back in the buffer for the next flush; if connect is given a new
+    connection is opened with connect() and the flush is retried once right away first. When the
+    database rejected the flush for any other reason its rows are written again one at a time, and
+    only the rejected ones are dropped and counted in stats.dropped without raising.
+    '''
+    connection_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+    def __init__(self, connection, table_name, flush_size, flush_interval, after_write=(), after_commit=(), stats_every=0, connect=None):
+        self.connection = connection
+        self.table_name = table_name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.after_write = after_write
+        self.after_commit = after_commit
+        self.stats_every = stats_every #log the statistics every n flushes, 0 to disable
+        self.connect = connect
+        self.stats = FlushStats()
+        self._rows = []
+        self._oldest = None #time at which the oldest buffered row was added
+        self._broken = False #the connection was lost, open a new one before the next flush
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name='writer-flush', daemon=True)
+        self._timer.start()
+
+    def add(self, row):
+        '''
+        Buffer a single row, flushing if the buffer is full
+        '''
+        self.add_many((row,))
+
+    def add_many(self, rows):
+        '''
+        Buffer several rows, flushing if the buffer is full
+        '''
+        with self._lock:
+            if not self._rows:
+                self._oldest = time.monotonic()
+            #Buffered before flushing, so that no row is lost if the flush fails
+            self._rows.extend(rows)
+            if len(self._rows) >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        '''
+        Write all the buffered rows in a single transaction
+        '''
+        with self._lock:
+            if not self._rows:
+                return
+            rows, oldest = self._rows, self._oldest
+            self._rows = []
+            self._oldest = None
+            start = time.perf_counter()
+            error = None
+            try:
+                try:
+                    self._flush_rows(rows)
+                except self.connection_errors:
+                    if self.connect is None:
+                        raise
+                    logger.warning('Lost the connection to the database, reconnecting to flush %d rows', len(rows))
+                    self._flush_rows(rows)
+                written = rows
+            except Exception:
+                self.stats.failures += 1
+                FLUSH_FAILURES.inc()
+                if self._broken:
+                    #The rows are fine, the connection isn't: keep them ahead of the rows buffered since
+                    logger.exception('Failed to flush %d rows to %s, keeping them for the next flush', len(rows), self.table_name)
+                    self._rows = rows + self._rows
+                    self._oldest = oldest
+                    raise
+                logger.exception('Failed to flush %d rows to %s, writing them one at a time', len(rows), self.table_name)
+                written, error = self._flush_one_at_a_time(rows, oldest)
+            self.stats.record(len(written), time.perf_counter() - start)
+            FLUSHED_ROWS.inc(len(written))
+            if written:
+                for after_commit in self.after_commit:
+                    after_commit(written)
+            if self.stats_every and self.stats.flushes % self.stats_every == 0:
+                logger.info('Flush stats: %s', self.stats.summary())
+            if error is not None:
+                raise error
+
+    def _flush_one_at_a_time(self, rows, oldest):
+        '''
+        Write the rows of a rejected flush one per transaction, dropping the rows rejected again.
+        Returns the rows written and the error that lost the connection, if it was lost
+        '''
+        written = []
+        for i, row in enumerate(rows):
+            try:
+                self._flush_rows([row])
+            except Exception as error:
+                if self._broken:
+                    #Keep the rows not written yet for the next flush, like a failed flush
+                    logger.exception('Failed to flush %d rows to %s, keeping them for the next flush', len(rows) - i, self.table_name)
+                    self._rows = rows[i:] + self._rows
+                    self._oldest = oldest
+                    return written, error
+                #Writing the same row again would fail the same way
+                self.stats.dropped += 1
+                logger.exception('Row of tweet %s rejected by %s, dropping it', row[0], self.table_name)
+                continue
+            written.append(row)
+        return written, None
+
+    def _flush_rows(self, rows):
+        if self._broken and self.connect is not None:
+            self._reconnect()
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            with FLUSH_SECONDS.labels('insert').time():
+                self._write(cursor, rows)
+            with FLUSH_SECONDS.labels('after_write').time():
+                for after_write in self.after_write:
+                    after_write(cursor, rows)
+            with FLUSH_SECONDS.labels('commit').time():
+                self.connection.commit()
+        except self.connection_errors:
+            self._broken = True
+            raise
+        except Exception:
+            self._rollback()
+            raise
+        finally:
+            if cursor is not None and not self._broken:
+                cursor.close()
+
+    def _rollback(self):
+        try:
+            self.connection.rollback()
+        except Exception:
+            #The connection can't be used any more, a new one is opened for the next flush
+            logger.exception('Failed to roll back the flush')
+            self._broken = True
+
+    def _reconnect(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass #already closed by the server
+        self.connection = self.connect()
+        self._broken = False
+
+    def close(self):
+        '''
+        Stop the background thread and write whatever is still buffered
+        '''
+        self._closed.set()
+        self._timer.join()
+        try:
+            self.flush()
+        except Exception:
+            #Already logged by flush(), there won't be another one for the rows still buffered
+            self.stats.dropped += len(self._rows)
+            self._rows = []
+        logger.info('Writer closed: %s', self.stats.summary())
+
+    def _write(self, cursor, rows):
+        #A single multi-row INSERT instead of one round trip per tweet
+        query = f"INSERT INTO {self.table_name} ({', '.join(COLUMNS)}) VALUES %s"
+        execute_values(cursor, query, rows, page_size=len(rows))
+
+    def _flush_periodically(self):
+        #Wake up a few times per interval so that a row is never kept much longer than flush_interval
+        while not self._closed.wait(self.flush_interval / 4):
+            with self._lock:
+                expired = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+                if expired:
+                    try:
+                        self.flush()
+                    except Exception:
+                        #Already logged by flush(), keep the thread alive for the next batch
+                        pass
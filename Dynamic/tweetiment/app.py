@@ -1,28 +1,28 @@
 #Code for all that happens in the frontend of the Web Application
 import pandas as pd
-import re
 import nltk
-nltk.download('punkt')
 nltk.download('stopwords')
-from nltk.probability import FreqDist
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from textblob import TextBlob
 
 import dash
 from dash import dcc
 from dash import html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 
 import plotly.graph_objs as go
 import settings
-import itertools
 import math
 import base64
-from flask import Flask
+from flask import Flask, Response
 import os
-import psycopg2
 import datetime
+import functools
+from store import STAGE_SECONDS, RollupStore, TweetStore
+from downsample import downsample
+from geo import INV_STATE_DICTIONARY
+from words import WordCounter, word_polarity
+from refresher import Refresher
+from metrics import CONTENT_TYPE, Histogram, render
  
 #Dash default CSS sheet
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
@@ -32,16 +32,155 @@ app.title = 'Tweetiment'
 
 server = app.server
 
+CALLBACK_SECONDS = Histogram('dashboard_callback_seconds', 'Seconds taken by each callback of the dashboard', ['callback'])
+
+def timed(callback):
+    '''
+    Time every call of callback in CALLBACK_SECONDS
+    '''
+    @functools.wraps(callback)
+    def wrapper(*args):
+        with CALLBACK_SECONDS.labels(callback.__name__).time():
+            return callback(*args)
+    return wrapper
+
+#The metrics of this gunicorn worker (each worker has its own) in the Prometheus text format
+@server.route('/metrics')
+def metrics():
+    return Response(render(), content_type=CONTENT_TYPE)
+
+#Data shared by both callbacks, only the rows newer than the last refresh are fetched every interval
+#and the word frequencies are updated as the tweets enter and leave the window
+word_counter = WordCounter()
+store = TweetStore(settings.TABLE_NAME,
+                   utc_offset=datetime.timedelta(hours=settings.UTC_OFFSET_HOURS),
+                   window=datetime.timedelta(hours=settings.STORE_WINDOW_HOURS),
+                   max_rows=settings.STORE_MAX_ROWS,
+                   lookback=datetime.timedelta(seconds=settings.STORE_LOOKBACK_SECONDS),
+                   trackers=[word_counter])
+rollups = RollupStore(settings.ROLLUP_TABLE_NAME, settings.DAILY_TABLE_NAME,
+                      utc_offset=datetime.timedelta(hours=settings.UTC_OFFSET_HOURS),
+                      window=datetime.timedelta(hours=settings.ROLLUP_WINDOW_HOURS),
+                      lookback=datetime.timedelta(seconds=settings.STORE_LOOKBACK_SECONDS))
+
+def compute_top(counts, daily_tweets_num, daily_impressions):
+    '''
+    Compute the data of the top part of the dashboard
+    '''
+    #The per-polarity counts in 10 second buckets and the daily totals are maintained at ingest by the scraper
+    now = datetime.datetime.utcnow() + datetime.timedelta(hours=settings.UTC_OFFSET_HOURS)
+    min10 = now - datetime.timedelta(minutes=10)
+    min20 = now - datetime.timedelta(minutes=20)
+
+    neutrals = counts[counts.index > min10][0].sum()
+    negatives = counts[counts.index > min10][-1].sum()
+    positives = counts[counts.index > min10][1].sum()
+
+    #Percentage change of the Number of Tweets in the last 10 minutes, compared to the previous 10 minutes
+    count_now = counts[counts.index > min10].sum().sum()
+    count_before = counts[(min20 < counts.index) & (counts.index < min10)].sum().sum()
+    percent = (count_now-count_before)/count_before*100 if count_before else 0.0
+    return {'counts': counts,
+            'positives': positives, 'negatives': negatives, 'neutrals': neutrals,
+            'percent': percent, 'daily_impressions': daily_impressions, 'daily_tweets_num': daily_tweets_num}
+
+def compute_bottom(tweets):
+    '''
+    Compute the data of the bottom part of the dashboard
+    '''
+    #Geo-distribution, the US state of every tweet is resolved at ingest
+    with STAGE_SECONDS.labels('geo_count').time():
+        geo_distribution = tweets['user_state'].dropna().value_counts().rename_axis('State').reset_index(name='Number')
+        geo_distribution["Logarithm"] = geo_distribution["Number"].apply(lambda x: math.log(x))
+        geo_distribution['Full State Name'] = geo_distribution['State'].map(INV_STATE_DICTIONARY)
+        geo_distribution['text'] = geo_distribution['Full State Name'] + '<br>' + 'Number: ' + geo_distribution['Number'].astype(str)
+
+    #Word frequency, the words are counted as the tweets enter and leave the window
+    with STAGE_SECONDS.labels('word_frequency').time():
+        frequency_distribution = pd.DataFrame(word_counter.most_common(16), columns = ["Word", "Frequency"]).iloc[1:]
+        frequency_distribution['Polarity'] = frequency_distribution['Word'].map(word_polarity)
+        frequency_distribution['Marker_Color'] = frequency_distribution['Polarity'].apply(lambda x: 'rgba(255, 50, 50, 0.6)' if x < -0.1 else ('rgba(184, 247, 212, 0.6)' if x > 0.1 else 'rgba(131, 90, 241, 0.6)'))
+        frequency_distribution['Line_Color'] = frequency_distribution['Polarity'].apply(lambda x: 'rgba(255, 50, 50, 1)' if x < -0.1 else ('rgba(184, 247, 212, 1)' if x > 0.1 else 'rgba(131, 90, 241, 1)'))
+    return {'frequency_distribution': frequency_distribution, 'geo_distribution': geo_distribution}
+
+def refresh_top(connection):
+    '''
+    Load the new rollups from Heroku PostgreSQL and compute the top part of the dashboard
+    '''
+    rollups.refresh(connection)
+    return compute_top(*rollups.snapshot())
+
+def refresh_bottom(connection):
+    '''
+    Load the new tweets from Heroku PostgreSQL and compute the bottom part of the dashboard
+    '''
+    store.refresh(connection)
+    return compute_bottom(store.snapshot())
+
+#A single refresh loop per gunicorn worker on pooled connections, the callbacks serve its latest results
+refresher = Refresher(os.environ.get('DATABASE_URL'), {'top': refresh_top, 'bottom': refresh_bottom},
+                      interval=settings.REFRESH_INTERVAL,
+                      max_connections=settings.POOL_MAX_CONNECTIONS,
+                      sslmode='require')
+
 #Dash layout
-#The core framework of Dash web app is using app.layout as a background layout
+#The core framework of Dash web app is using app.layout as a background layout. It is sent once, the callbacks
+#below only send the numbers that change: new points of the time series, the pie, the KPIs and the bottom charts.
 
 #1. html.Div(id='live-update-graph') describes the top part of the dashboard in the application, including descriptions for tweet number and potential impressions.
 #2. html.Div(id='live-update-graph-bottom') describes the bottom part of the dashboard in the web app.
 #3. dcc.Interval is the key to allow the application to update information regularly, i.e. timer for updating data every 10 seconds
+#4. dcc.Store(id='series-watermark') remembers, per browser tab, the last bucket of the time series it was sent
+top_layout = [html.Div([html.Div([dcc.Graph(id='crossfilter-indicator-scatter', 
+                                            figure={'data': [go.Scatter(x=[],
+                                                                        y=[],
+                                                                        name="Neutral",
+                                                                        opacity=0.8,
+                                                                        mode='lines',
+                                                                        line=dict(width=0.5, color='rgb(131, 90, 241)'),
+                                                                        stackgroup='one'),
+                                                             go.Scatter(x=[],
+                                                                        y=[],
+                                                                        name="Negative",
+                                                                        opacity=0.8,
+                                                                        mode='lines',
+                                                                        line=dict(width=0.5, color='rgb(255, 50, 50)'),
+                                                                        stackgroup='two' 
+                                                   ),
+                                                             go.Scatter(x=[],
+                                                                        y=[],
+                                                                        name="Positive",
+                                                                        opacity=0.8,
+                                                                        mode='lines',
+                                                                        line=dict(width=0.5, color='rgb(184, 247, 212)'),
+                                                                        stackgroup='three' 
+                                                                       )]})], 
+                                 style={'width': '73%', 'display': 'inline-block', 'padding': '0 0 0 20'}),
+                        html.Div([dcc.Graph(id='pie-chart')],
+                                 style={'width': '27%', 'display': 'inline-block'})]),
+              html.Div(className='row',
+                       children=[html.Div(children=[html.P('Tweets/10 minutes Changed By', style={'fontSize': 17}),
+                                                    html.P(id='percent-change', style={'fontSize': 40})], 
+                                          style={'width': '20%', 'display': 'inline-block'}),
+                                 html.Div(children=[html.P('Potential Impressions Today', style={'fontSize': 17}),
+                                                    html.P(id='daily-impressions', style={'fontSize': 40})], 
+                                          style={'width': '20%', 'display': 'inline-block'}),
+                                 html.Div(children=[html.P('Tweets Posted Today', style={'fontSize': 17}),
+                                                    html.P(id='daily-tweets', style={'fontSize': 40})], 
+                                          style={'width': '20%', 'display': 'inline-block'}),
+                                 html.Div(children=[html.P(f"Currently tracking \"{settings.TRACK_WORDS}\" (NASDAQ: FB) on Twitter in Pacific Daylight Time (PDT).", style={'fontSize': 25})], 
+                                          style={'width': '40%', 'display': 'inline-block'})],
+                       style={'marginLeft': 70})]
+
+bottom_layout = [html.Div([dcc.Graph(id='x-time-series')],
+                          style={'width': '49%', 'display': 'inline-block', 'padding': '0 0 0 20'}),
+                 html.Div([dcc.Graph(id='y-time-series')], 
+                          style={'display': 'inline-block', 'width': '49%'})]
+
 app.layout = html.Div(children=[html.H2('Twitter Sentiment Analysis', style={'textAlign': 'center'}),
                                 html.H4('(Last App update: July 1, 2022)', style={'textAlign': 'right'}),
-                                html.Div(id='live-update-graph'),
-                                html.Div(id='live-update-graph-bottom'),
+                                html.Div(id='live-update-graph', children=top_layout),
+                                html.Div(id='live-update-graph-bottom', children=bottom_layout),
                                 html.Div(className='row', 
                                          children=[dcc.Markdown("__Tracking sentiments to see how the world is feeling!__"),], style={'width': '35%', 'marginLeft': 70}),
                                 html.Br(),
@@ -59,196 +198,111 @@ app.layout = html.Div(children=[html.H2('Twitter Sentiment Analysis', style={'te
                                                             children=[html.P('Developed by:'),
                                                                       html.A('Mrigank Sondhi', href='https://www.linkedin.com/in/mrigank-sondhi/')])],
                                          style={'marginLeft': 70, 'fontSize': 16}),
+                                dcc.Store(id='series-watermark'),
                                 dcc.Interval(id='interval-component-slow',
-                                             interval=1*10000, # in milliseconds
+                                             interval=settings.REFRESH_INTERVAL*1000, # in milliseconds
                                              n_intervals=0)], 
                       style={'padding': '20px'})
 
-#Multiple components can update everytime an interval gets fired.
-#html.Div(id='live-update-graph') describes the top part of the dashboard in the application, including descriptions for tweet number and potential impressions.
-@app.callback(Output('live-update-graph', 'children'), [Input('interval-component-slow', 'n_intervals')])
+def series_update(counts, watermark):
+    '''
+    The buckets of counts after watermark (every bucket if None) that the scraper is done with,
+    downsampled to at most SERIES_MAX_POINTS, and the new watermark
+    '''
+    #The most recent buckets are still being filled, they are sent once they are settled
+    settled = datetime.datetime.utcnow() + datetime.timedelta(hours=settings.UTC_OFFSET_HOURS, seconds=-settings.SERIES_SETTLE_SECONDS)
+    new = counts[counts.index < settled]
+    if watermark is not None:
+        new = new[new.index > pd.Timestamp(watermark)]
+    if new.empty:
+        return None, watermark
+    new = downsample(new, settings.SERIES_MAX_POINTS)
+    time_series = new.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
+    #Same order as the traces of the figure: Neutral, Negative, Positive
+    extension = dict(x=[time_series] * 3, y=[new[0].tolist(), (-new[-1]).tolist(), new[1].tolist()])
+    return (extension, [0, 1, 2], settings.SERIES_MAX_POINTS), time_series[-1]
 
+#The time series only receives the buckets it doesn't have yet, appended to its traces with extendData
+@app.callback([Output('crossfilter-indicator-scatter', 'extendData'), Output('series-watermark', 'data')],
+              [Input('interval-component-slow', 'n_intervals')],
+              [State('series-watermark', 'data')])
+
+@timed
+def update_time_series(n, watermark):
+    #Serving the latest data computed by the background refresher
+    top = refresher.latest('top', timeout=settings.REFRESH_INTERVAL)
+    if top is None:
+        raise PreventUpdate
+    extension, watermark = series_update(top['counts'], watermark)
+    if extension is None:
+        raise PreventUpdate
+    return extension, watermark
+
+#The pie chart and the numbers of the top part of the dashboard
+@app.callback([Output('pie-chart', 'figure'), Output('percent-change', 'children'),
+               Output('daily-impressions', 'children'), Output('daily-tweets', 'children')],
+              [Input('interval-component-slow', 'n_intervals')])
+
+@timed
 def update_graph_live(n):
-    #Loading data from Heroku PostgreSQL database
-    DATABASE_URL = os.environ['DATABASE_URL']
-    connection = psycopg2.connect(DATABASE_URL, sslmode='require')
-    query = f"SELECT tweet_id, text, created_at, polarity, user_location, user_followers_count FROM {settings.TABLE_NAME}"
-    df = pd.read_sql(query, con=connection)
-
-    #Convert UTC to PDT (Pacific Daylight Time)
-    df['created_at'] = pd.to_datetime(df['created_at']).apply(lambda x: x - datetime.timedelta(hours=7))
-
-    #Clean and transform the data to enable time series analysis
-    result = df.groupby([pd.Grouper(key='created_at', freq='10s'), 'polarity']).count().unstack(fill_value=0).stack().reset_index()
-    result = result.rename(columns={"tweet_id":f"Number of '{settings.TRACK_WORDS}' mentions", "created_at":"Time"})  
-    time_series = result["Time"][result['polarity']==0].reset_index(drop=True)
-    min10 = datetime.datetime.now() - datetime.timedelta(hours=7, minutes=10)
-    min20 = datetime.datetime.now() - datetime.timedelta(hours=7, minutes=20)
-
-    neutrals = result[result['Time']>min10][f"Number of '{settings.TRACK_WORDS}' mentions"][result['polarity']==0].sum()
-    negatives = result[result['Time']>min10][f"Number of '{settings.TRACK_WORDS}' mentions"][result['polarity']==-1].sum()
-    positives = result[result['Time']>min10][f"Number of '{settings.TRACK_WORDS}' mentions"][result['polarity']==1].sum()
-    
-    #Loading summary data
-    query = "SELECT daily_tweets_num, impressions FROM summary;"
-    summary = pd.read_sql(query, con=connection)  
-    daily_tweets_num = summary['daily_tweets_num'].iloc[0] + result[-6:-3][f"Number of '{settings.TRACK_WORDS}' mentions"].sum()
-    daily_impressions = summary['impressions'].iloc[0] + df[df['created_at'] > (datetime.datetime.now() - datetime.timedelta(hours=7, seconds=10))]['user_followers_count'].sum()
-    
-    cursor = connection.cursor()
-    PDT_now = datetime.datetime.now() - datetime.timedelta(hours=7)
-    if PDT_now.strftime("%H%M")=='0000':
-        cursor.execute("UPDATE summary SET daily_tweets_num = 0, impressions = 0;")
-    else:
-        cursor.execute(f"UPDATE summary SET daily_tweets_num = {daily_tweets_num}, impressions = {daily_impressions};")
-    connection.commit()
-    cursor.close()
-    connection.close()
+    #Serving the latest data computed by the background refresher
+    top = refresher.latest('top', timeout=settings.REFRESH_INTERVAL)
+    if top is None:
+        raise PreventUpdate
+    positives, negatives, neutrals = top['positives'], top['negatives'], top['neutrals']
+    percent, daily_impressions, daily_tweets_num = top['percent'], top['daily_impressions'], top['daily_tweets_num']
 
-    #Percentage change of the Number of Tweets in the last 10 minutes, compared to the previous 10 minutes
-    count_now = df[df['created_at'] > min10]['tweet_id'].count()
-    count_before = df[(min20 < df['created_at']) & (df['created_at'] < min10)]['tweet_id'].count()
-    percent = (count_now-count_before)/count_before*100
-    
-    #Create the graph 
-    children = [html.Div([html.Div([dcc.Graph(id='crossfilter-indicator-scatter', 
-                                              figure={'data': [go.Scatter(x=time_series,
-                                                                          y=result[f"Number of '{settings.TRACK_WORDS}' mentions"][result['polarity']==0].reset_index(drop=True),
-                                                                          name="Neutral",
-                                                                          opacity=0.8,
-                                                                          mode='lines',
-                                                                          line=dict(width=0.5, color='rgb(131, 90, 241)'),
-                                                                          stackgroup='one'),
-                                                               go.Scatter(x=time_series,
-                                                                          y=result[f"Number of '{settings.TRACK_WORDS}' mentions"][result['polarity']==-1].reset_index(drop=True).apply(lambda x: -x),
-                                                                          name="Negative",
-                                                                          opacity=0.8,
-                                                                          mode='lines',
-                                                                          line=dict(width=0.5, color='rgb(255, 50, 50)'),
-                                                                          stackgroup='two' 
-                                                     ),
-                                                               go.Scatter(x=time_series,
-                                                                          y=result[f"Number of '{settings.TRACK_WORDS}' mentions"][result['polarity']==1].reset_index(drop=True),
-                                                                          name="Positive",
-                                                                          opacity=0.8,
-                                                                          mode='lines',
-                                                                          line=dict(width=0.5, color='rgb(184, 247, 212)'),
-                                                                          stackgroup='three' 
-                                                                         )]})], 
-                                   style={'width': '73%', 'display': 'inline-block', 'padding': '0 0 0 20'}),
-                          html.Div([dcc.Graph(id='pie-chart',
-                                              figure={'data': [go.Pie(labels=['Positive', 'Negative', 'Neutral'], 
-                                                                      values=[positives, negatives, neutrals],
-                                                                      name="View Metrics",
-                                                                      marker_colors=['rgba(184, 247, 212, 0.6)','rgba(255, 50, 50, 0.6)','rgba(131, 90, 241, 0.6)'],
-                                                                      textinfo='value',
-                                                                      hole=.65)],
-                                                      'layout':{'showlegend':False,
-                                                                'title':'Tweets in the last 10 minutes',
-                                                                'annotations':[
-                                                                    dict(text='{0:.1f}K'.format((positives + negatives + neutrals)/1000),
-                                                                         font=dict(size=40),
-                                                                         showarrow=False)]}})],
-                                   style={'width': '27%', 'display': 'inline-block'})]),
-                html.Div(className='row',
-                         children=[html.Div(children=[html.P('Tweets/10 minutes Changed By', style={'fontSize': 17}),
-                                                      html.P('{0:.2f}%'.format(percent) if percent <= 0 else ' {0:.2f}%'.format(percent), style={'fontSize': 40})], 
-                                            style={'width': '20%', 'display': 'inline-block'}),
-                                   html.Div(children=[html.P('Potential Impressions Today', style={'fontSize': 17}),
-                                                      html.P('{0:.1f}K'.format(daily_impressions/1000) if daily_impressions < 1000000 else ('{0:.1f}M'.format(daily_impressions/1000000) if daily_impressions < 1000000000 else '{0:.1f}B'.format(daily_impressions/1000000000)),
-                                                             style={'fontSize': 40})], 
-                                            style={'width': '20%', 'display': 'inline-block'}),
-                                   html.Div(children=[html.P('Tweets Posted Today', style={'fontSize': 17}),
-                                                      html.P('{0:.1f}K'.format(daily_tweets_num/1000), 
-                                                             style={'fontSize': 40})], 
-                                            style={'width': '20%', 'display': 'inline-block'}),
-                                   html.Div(children=[html.P(f"Currently tracking \"{settings.TRACK_WORDS}\" (NASDAQ: FB) on Twitter in Pacific Daylight Time (PDT).", style={'fontSize': 25})], 
-                                            style={'width': '40%', 'display': 'inline-block'})],
-                         style={'marginLeft': 70})]
-    return children
+    with STAGE_SECONDS.labels('figure').time():
+        pie = {'data': [go.Pie(labels=['Positive', 'Negative', 'Neutral'], 
+                               values=[positives, negatives, neutrals],
+                               name="View Metrics",
+                               marker_colors=['rgba(184, 247, 212, 0.6)','rgba(255, 50, 50, 0.6)','rgba(131, 90, 241, 0.6)'],
+                               textinfo='value',
+                               hole=.65)],
+               'layout':{'showlegend':False,
+                         'title':'Tweets in the last 10 minutes',
+                         'annotations':[
+                             dict(text='{0:.1f}K'.format((positives + negatives + neutrals)/1000),
+                                  font=dict(size=40),
+                                  showarrow=False)]}}
+    return (pie,
+            '{0:.2f}%'.format(percent) if percent <= 0 else ' {0:.2f}%'.format(percent),
+            '{0:.1f}K'.format(daily_impressions/1000) if daily_impressions < 1000000 else ('{0:.1f}M'.format(daily_impressions/1000000) if daily_impressions < 1000000000 else '{0:.1f}B'.format(daily_impressions/1000000000)),
+            '{0:.1f}K'.format(daily_tweets_num/1000))
 
 #html.Div(id='live-update-graph-bottom') describes the bottom part of the dashboard in the web app.
-@app.callback(Output('live-update-graph-bottom', 'children'), [Input('interval-component-slow', 'n_intervals')])
+@app.callback([Output('x-time-series', 'figure'), Output('y-time-series', 'figure')], [Input('interval-component-slow', 'n_intervals')])
 
+@timed
 def update_graph_bottom_live(n):
-    #Loading data from Heroku PostgreSQL
-    DATABASE_URL = os.environ['DATABASE_URL']
-    connection = psycopg2.connect(DATABASE_URL, sslmode='require')
-    query = f"SELECT tweet_id, text, created_at, polarity, user_location FROM {settings.TABLE_NAME}"
-    df = pd.read_sql(query, con=connection)
-    connection.close()
-
-    #Convert UTC to PDT
-    df['created_at'] = pd.to_datetime(df['created_at']).apply(lambda x: x - datetime.timedelta(hours=7))
-
-    #Clean and transform the data to enable word frequency
-    data = ' '.join(df["text"])
-    data = re.sub(r"http\S+", "", data)
-    data = data.replace('RT ', ' ').replace('&amp;', 'and')
-    data = re.sub('[^A-Za-z0-9]+', ' ', data)
-    data = data.lower()
-
-    #Filter constants for states in US
-    STATES = ['Alabama', 'AL', 'Alaska', 'AK', 'American Samoa', 'AS', 'Arizona', 'AZ', 'Arkansas', 'AR', 'California', 'CA', 'Colorado', 'CO', 'Connecticut', 'CT', 'Delaware', 'DE', 'District of Columbia', 'DC', 'Federated States of Micronesia', 'FM', 'Florida', 'FL', 'Georgia', 'GA', 'Guam', 'GU', 'Hawaii', 'HI', 'Idaho', 'ID', 'Illinois', 'IL', 'Indiana', 'IN', 'Iowa', 'IA', 'Kansas', 'KS', 'Kentucky', 'KY', 'Louisiana', 'LA', 'Maine', 'ME', 'Marshall Islands', 'MH', 'Maryland', 'MD', 'Massachusetts', 'MA', 'Michigan', 'MI', 'Minnesota', 'MN', 'Mississippi', 'MS', 'Missouri', 'MO', 'Montana', 'MT', 'Nebraska', 'NE', 'Nevada', 'NV', 'New Hampshire', 'NH', 'New Jersey', 'NJ', 'New Mexico', 'NM', 'New York', 'NY', 'North Carolina', 'NC', 'North Dakota', 'ND', 'Northern Mariana Islands', 'MP', 'Ohio', 'OH', 'Oklahoma', 'OK', 'Oregon', 'OR', 'Palau', 'PW', 'Pennsylvania', 'PA', 'Puerto Rico', 'PR', 'Rhode Island', 'RI', 'South Carolina', 'SC', 'South Dakota', 'SD', 'Tennessee', 'TN', 'Texas', 'TX', 'Utah', 'UT', 'Vermont', 'VT', 'Virgin Islands', 'VI', 'Virginia', 'VA', 'Washington', 'WA', 'West Virginia', 'WV', 'Wisconsin', 'WI', 'Wyoming', 'WY']
-    STATE_DICTIONARY = dict(itertools.zip_longest(*[iter(STATES)] * 2, fillvalue=""))
-    INV_STATE_DICTIONARY = dict((v,k) for k,v in STATE_DICTIONARY.items())
-
-    #Clean and transform data to enable geo-distribution
-    US = []
-    df = df.fillna(" ")
-    for location in df['user_location']:
-        flag = False
-        for state in STATES:
-            if state.lower() in location.lower():
-                US.append(STATE_DICTIONARY[state] if state in STATE_DICTIONARY else state)
-                flag = True
-                break
-        if not flag:
-            US.append(None)
-
-    geo_distribution = pd.DataFrame(US, columns=['State']).dropna().reset_index()
-    geo_distribution = geo_distribution.groupby('State').count().rename(columns={"index": "Number"}).sort_values(by=['Number'], ascending=False).reset_index()
-    geo_distribution["Logarithm"] = geo_distribution["Number"].apply(lambda x: math.log(x))
-    geo_distribution['Full State Name'] = geo_distribution['State'].apply(lambda x: INV_STATE_DICTIONARY[x])
-    geo_distribution['text'] = geo_distribution['Full State Name'] + '<br>' + 'Number: ' + geo_distribution['Number'].astype(str)
-
-    tokenized_word = word_tokenize(data)
-    stop_words = set(stopwords.words("english"))
-    filtered_sent = []
-    for word in tokenized_word:
-        if (word not in stop_words) and (len(word) >= 3):
-            filtered_sent.append(word)
-    frequency_distribution = FreqDist(filtered_sent)
-    frequency_distribution = pd.DataFrame(frequency_distribution.most_common(16), columns = ["Word", "Frequency"]).drop([0]).reindex()
-    frequency_distribution['Polarity'] = frequency_distribution['Word'].apply(lambda x: TextBlob(x).sentiment.polarity)
-    frequency_distribution['Marker_Color'] = frequency_distribution['Polarity'].apply(lambda x: 'rgba(255, 50, 50, 0.6)' if x < -0.1 else ('rgba(184, 247, 212, 0.6)' if x > 0.1 else 'rgba(131, 90, 241, 0.6)'))
-    frequency_distribution['Line_Color'] = frequency_distribution['Polarity'].apply(lambda x: 'rgba(255, 50, 50, 1)' if x < -0.1 else ('rgba(184, 247, 212, 1)' if x > 0.1 else 'rgba(131, 90, 241, 1)'))
-
-    #Create the graph 
-    children = [html.Div([dcc.Graph(id='x-time-series',
-                                    figure = {'data':[go.Bar(x=frequency_distribution["Frequency"].loc[::-1],
-                                                             y=frequency_distribution["Word"].loc[::-1], 
-                                                             name="Neutrals", 
-                                                             orientation='h',
-                                                             marker_color=frequency_distribution['Marker_Color'].loc[::-1].to_list(),
-                                                             marker=dict(
-                                                                 line=dict(color=frequency_distribution['Line_Color'].loc[::-1].to_list(),
-                                                                           width=1)))],
-                                              'layout':{'hovermode':"closest"}})],
-                         style={'width': '49%', 'display': 'inline-block', 'padding': '0 0 0 20'}),
-                html.Div([dcc.Graph(id='y-time-series',
-                                    figure = {'data':[go.Choropleth(locations=geo_distribution['State'], #Spatial coordinates
-                                                                    z = geo_distribution['Logarithm'].astype(float), #Data to be color-coded
-                                                                    locationmode = 'USA-states', #set of locations match entries in `locations` 
-                                                                    text=geo_distribution['text'], #hover text
-                                                                    geo = 'geo',
-                                                                    colorbar_title = "Number in natural log",
-                                                                    marker_line_color='white',
-                                                                    colorscale = ["#fdf7ff", "#835af1"])],
-                                              'layout': {'title': "Geographic Segmentation of the Unites States",
-                                                         'geo':{'scope':'usa'}}})], 
-                         style={'display': 'inline-block', 'width': '49%'})]
-    return children
+    #Serving the latest data computed by the background refresher
+    bottom = refresher.latest('bottom', timeout=settings.REFRESH_INTERVAL)
+    if bottom is None:
+        raise PreventUpdate
+    frequency_distribution, geo_distribution = bottom['frequency_distribution'], bottom['geo_distribution']
+
+    #Create the graphs 
+    with STAGE_SECONDS.labels('figure').time():
+        words = {'data':[go.Bar(x=frequency_distribution["Frequency"].loc[::-1],
+                                y=frequency_distribution["Word"].loc[::-1], 
+                                name="Neutrals", 
+                                orientation='h',
+                                marker_color=frequency_distribution['Marker_Color'].loc[::-1].to_list(),
+                                marker=dict(
+                                    line=dict(color=frequency_distribution['Line_Color'].loc[::-1].to_list(),
+                                              width=1)))],
+                 'layout':{'hovermode':"closest"}}
+        states = {'data':[go.Choropleth(locations=geo_distribution['State'], #Spatial coordinates
+                                        z = geo_distribution['Logarithm'].astype(float), #Data to be color-coded
+                                        locationmode = 'USA-states', #set of locations match entries in `locations` 
+                                        text=geo_distribution['text'], #hover text
+                                        geo = 'geo',
+                                        colorbar_title = "Number in natural log",
+                                        marker_line_color='white',
+                                        colorscale = ["#fdf7ff", "#835af1"])],
+                  'layout': {'title': "Geographic Segmentation of the Unites States",
+                             'geo':{'scope':'usa'}}}
+    return words, states
 
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
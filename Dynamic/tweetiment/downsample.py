@@ -0,0 +1,44 @@
+#This file reduces long time series to a bounded number of points before they are sent to the browser:
+#1. Largest-Triangle-Three-Buckets (LTTB) keeps the points that preserve the visual shape of a series
+#2. The points are picked on one series and applied to all of them, so that the traces stay aligned
+
+import numpy as np
+
+def lttb(y, n):
+    '''
+    Indices of the n points of y (evenly spaced samples) kept by Largest-Triangle-Three-Buckets.
+    The first and the last points are always kept; all the indices are returned if y has n points or less.
+    '''
+    y = np.asarray(y, dtype='float64')
+    length = len(y)
+    if n >= length or n < 3:
+        return np.arange(length)
+    x = np.arange(length, dtype='float64')
+    #The points between the first and the last one are split into n - 2 buckets, one point is kept per bucket
+    edges = np.linspace(1, length - 1, n - 1).astype('int64')
+    indices = np.empty(n, dtype='int64')
+    indices[0] = 0
+    indices[-1] = length - 1
+    selected = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        #The third point of the triangle is the average of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < n - 1 else length
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+        #Keep the point forming the largest triangle with the previously kept point and that average
+        areas = np.abs((x[selected] - average_x) * (y[start:end] - y[selected]) -
+                       (x[selected] - x[start:end]) * (average_y - y[selected]))
+        selected = start + int(areas.argmax())
+        indices[i + 1] = selected
+    return indices
+
+def downsample(frame, n, by=None):
+    '''
+    At most n rows of frame, picked by LTTB on the column by (the sum of the absolute values
+    of all the columns by default)
+    '''
+    if len(frame) <= n:
+        return frame
+    values = frame[by] if by is not None else frame.abs().sum(axis=1)
+    return frame.iloc[lttb(values.to_numpy(), n)]
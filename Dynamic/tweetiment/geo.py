@@ -0,0 +1,44 @@
+#This file resolves free-text user locations to US states:
+#1. The state names and abbreviations are compiled once, at import, into a single regular expression
+#2. Every location is matched in a single pass, on word boundaries, so that "CA" doesn't match "Jamaica",
+#   and the last state mentioned is kept
+#3. The results are memoized, as the same user locations come up again and again
+#
+#The same file is shipped with the dashboard (tweetiment/geo.py), keep both copies identical.
+
+import itertools
+import re
+from functools import lru_cache
+
+#State names in the US and their abbreviations
+STATES = ['Alabama', 'AL', 'Alaska', 'AK', 'American Samoa', 'AS', 'Arizona', 'AZ', 'Arkansas', 'AR', 'California', 'CA', 'Colorado', 'CO', 'Connecticut', 'CT', 'Delaware', 'DE', 'District of Columbia', 'DC', 'Federated States of Micronesia', 'FM', 'Florida', 'FL', 'Georgia', 'GA', 'Guam', 'GU', 'Hawaii', 'HI', 'Idaho', 'ID', 'Illinois', 'IL', 'Indiana', 'IN', 'Iowa', 'IA', 'Kansas', 'KS', 'Kentucky', 'KY', 'Louisiana', 'LA', 'Maine', 'ME', 'Marshall Islands', 'MH', 'Maryland', 'MD', 'Massachusetts', 'MA', 'Michigan', 'MI', 'Minnesota', 'MN', 'Mississippi', 'MS', 'Missouri', 'MO', 'Montana', 'MT', 'Nebraska', 'NE', 'Nevada', 'NV', 'New Hampshire', 'NH', 'New Jersey', 'NJ', 'New Mexico', 'NM', 'New York', 'NY', 'North Carolina', 'NC', 'North Dakota', 'ND', 'Northern Mariana Islands', 'MP', 'Ohio', 'OH', 'Oklahoma', 'OK', 'Oregon', 'OR', 'Palau', 'PW', 'Pennsylvania', 'PA', 'Puerto Rico', 'PR', 'Rhode Island', 'RI', 'South Carolina', 'SC', 'South Dakota', 'SD', 'Tennessee', 'TN', 'Texas', 'TX', 'Utah', 'UT', 'Vermont', 'VT', 'Virgin Islands', 'VI', 'Virginia', 'VA', 'Washington', 'WA', 'West Virginia', 'WV', 'Wisconsin', 'WI', 'Wyoming', 'WY']
+STATE_DICTIONARY = dict(itertools.zip_longest(*[iter(STATES)] * 2, fillvalue="")) #name -> abbreviation
+INV_STATE_DICTIONARY = dict((v,k) for k,v in STATE_DICTIONARY.items()) #abbreviation -> name
+
+CACHE_SIZE = 8192 #distinct locations remembered by resolve_state
+
+_NAMES = {name.lower(): abbreviation for name, abbreviation in STATE_DICTIONARY.items()}
+
+#Names match in any case, longest first so that "West Virginia" wins over "Virginia".
+#Abbreviations only match in upper case, otherwise "in", "or", "me", "hi" or "ok" would be taken for states.
+_PATTERN = re.compile(r'\b(?:(?i:(?P<name>' +
+                      '|'.join(re.escape(name).replace(r'\ ', r'\s+') for name in sorted(_NAMES, key=len, reverse=True)) +
+                      r'))|(?P<abbreviation>' + '|'.join(INV_STATE_DICTIONARY) + r'))\b')
+
+@lru_cache(maxsize=CACHE_SIZE)
+def resolve_state(location):
+    '''
+    Return the abbreviation of the US state mentioned in location, or None (also for anything
+    but a string, e.g. NaN). US locations are usually "City, ST" so the last mention wins, e.g.
+    "Austin, Texas" -> "TX", "Washington, DC" -> "DC", "Kansas City, MO" -> "MO", "Jamaica" -> None
+    '''
+    if not isinstance(location, str) or not location:
+        return None
+    match = None
+    for match in _PATTERN.finditer(location):
+        pass
+    if match is None:
+        return None
+    if match.group('name'):
+        return _NAMES[' '.join(match.group('name').lower().split())]
+    return match.group('abbreviation')
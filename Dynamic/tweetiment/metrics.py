@@ -0,0 +1,268 @@
+#This file implements the counters, gauges and histograms exposed on /metrics in the Prometheus text format:
+#1. Metrics are registered once, at import, in the module registry
+#2. Recording a value is a dict lookup and a few additions under a lock, cheap enough for the hot path
+#3. render() formats every metric of the registry for a Prometheus scrape
+#4. A Publisher copies the rendered metrics to a database table, for processes that can't be scraped themselves
+#
+#The same file is shipped with the dashboard (tweetiment/metrics.py), keep both copies identical.
+
+import bisect
+import datetime
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+#Upper bounds (in seconds) of the histogram buckets, from 10 microseconds to 10 seconds
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+class Registry:
+    '''
+    The metrics rendered together on /metrics
+    '''
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        '''
+        Every metric in the Prometheus text exposition format
+        '''
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        registry.register(self)
+
+    def labels(self, *values):
+        '''
+        The metric for the given label values, created the first time they are seen
+        '''
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _unlabelled(self):
+        return self._children[()]
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.name, self.labelnames, values)
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, values):
+        yield f'{name}{_format_labels(labelnames, values)} {_format_value(self.value)}'
+
+class Counter(_Metric):
+    '''
+    A value that only goes up, e.g. the number of tweets received; name it *_total
+    '''
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        '''
+        Compute the value when the metrics are rendered instead
+        '''
+        self.function = function
+
+    def samples(self, name, labelnames, values):
+        value = self.function() if self.function is not None else self.value
+        yield f'{name}{_format_labels(labelnames, values)} {_format_value(value)}'
+
+class Gauge(_Metric):
+    '''
+    A value that goes up and down, e.g. the depth of a queue
+    '''
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) #the last one counts the values above every bound
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        '''
+        Observe the seconds spent in the with block
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield f"{name}_bucket{_format_labels(labelnames, values, [('le', _format_value(bound))])} {cumulative}"
+        yield f'{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}'
+        yield f'{name}_count{_format_labels(labelnames, values)} {cumulative}'
+
+class Histogram(_Metric):
+    '''
+    The distribution of observed values, e.g. latencies in seconds, counted in buckets
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+def render(registry=REGISTRY):
+    return registry.render()
+
+#Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class Publisher:
+    '''
+    Writes the rendered registry to table_name (source, body, updated_at) every interval
+    seconds, from a daemon thread with its own connection.
+
+    On Heroku the worker dyno can't be reached over HTTP, so it publishes its metrics and the
+    web process serves them on /metrics with read_published().
+    '''
+    def __init__(self, dsn, table_name, source, interval=15.0, registry=REGISTRY, **connect_kwargs):
+        self.dsn = dsn
+        self.table_name = table_name
+        self.source = source
+        self.interval = interval
+        self.registry = registry
+        self.connect_kwargs = connect_kwargs
+        self._connection = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        '''
+        Publish a last time and stop
+        '''
+        self._closed.set()
+        self._thread.join()
+
+    def publish(self):
+        import psycopg2
+        try:
+            if self._connection is None:
+                self._connection = psycopg2.connect(self.dsn, **self.connect_kwargs)
+            with self._connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {self.table_name} (source, body, updated_at) VALUES (%s, %s, %s) "
+                               f"ON CONFLICT (source) DO UPDATE SET body = EXCLUDED.body, updated_at = EXCLUDED.updated_at",
+                               (self.source, self.registry.render(), datetime.datetime.utcnow()))
+            self._connection.commit()
+        except psycopg2.Error:
+            #The metrics are published again on the next interval, on a new connection
+            logger.exception('Failed to publish the metrics')
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            self.publish()
+        self.publish()
+        if self._connection is not None:
+            self._connection.close()
+
+def read_published(cursor, table_name):
+    '''
+    The metrics published to table_name by every source, with the age of each publication
+    '''
+    cursor.execute(f"SELECT source, body, updated_at FROM {table_name} ORDER BY source")
+    rows = cursor.fetchall()
+    now = datetime.datetime.utcnow()
+    lines = [body.rstrip('\n') for _, body, _ in rows]
+    lines.append('# HELP published_metrics_age_seconds Seconds since the metrics of the source were published')
+    lines.append('# TYPE published_metrics_age_seconds gauge')
+    for source, _, updated_at in rows:
+        lines.append(f'published_metrics_age_seconds{_format_labels(("source",), (source,))} {_format_value((now - updated_at).total_seconds())}')
+    return '\n'.join(lines) + '\n'
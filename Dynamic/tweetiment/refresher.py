@@ -0,0 +1,119 @@
+#This file implements the background refresh loop of the dashboard:
+#1. A single thread per gunicorn worker refreshes the data every interval, no matter how many tabs are open
+#2. Connections come from a pool instead of a new TLS handshake per callback
+#3. The callbacks only serve the latest computed result, each part of the dashboard is computed on its own so
+#   a failure in one does not hold back the others
+#4. The refreshes are timed and their failures counted, served on /metrics
+
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import pool
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = Histogram('dashboard_refresh_seconds', 'Seconds taken by a refresh of the dashboard data')
+REFRESH_FAILURES = Counter('dashboard_refresh_failures_total', 'Refreshes of the dashboard data that failed', ['part'])
+
+class Refresher:
+    '''
+    Calls every compute(connection) of computes, a dict of the parts of the dashboard, every
+    interval seconds on a pooled connection and keeps their results for the callbacks.
+    '''
+    def __init__(self, dsn, computes, interval, max_connections=2, **connect_kwargs):
+        self.dsn = dsn
+        self.computes = computes
+        self.interval = interval
+        self.max_connections = max_connections
+        self.connect_kwargs = connect_kwargs
+        self.results = {}
+        self.refreshed_at = {}
+        self.failures = 0
+        self._pool = None
+        self._ready = threading.Event()
+        self._started_lock = threading.Lock()
+        self._pid = None #process the thread was started in, gunicorn may fork after import
+
+    def start(self):
+        '''
+        Start the refresh thread in this process, if it is not running already
+        '''
+        with self._started_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            #Connections and threads are not inherited across a fork, start afresh. The pool is opened
+            #by the refresh thread, which tries again on every tick while the database is unreachable
+            self._pool = None
+            self._ready.clear()
+            threading.Thread(target=self._run, name='dashboard-refresher', daemon=True).start()
+
+    def latest(self, name, timeout=None):
+        '''
+        Return the latest result of a part, None if it has never been computed. Waits up to timeout
+        seconds for the first refresh attempt, but not once an attempt has finished, failed or not.
+        '''
+        self.start()
+        self._ready.wait(timeout)
+        return self.results.get(name)
+
+    def connection(self):
+        '''
+        Borrow a connection from the pool, to be returned with release()
+        '''
+        with self._started_lock:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(1, self.max_connections, self.dsn, **self.connect_kwargs)
+        return self._pool.getconn()
+
+    def release(self, connection, broken=False):
+        self._pool.putconn(connection, close=broken)
+
+    def refresh(self):
+        '''
+        Compute every part once, on a pooled connection. A part that fails keeps its previous result
+        '''
+        connection = self.connection()
+        broken = False
+        try:
+            for name, compute in self.computes.items():
+                try:
+                    result = compute(connection)
+                    connection.commit()
+                except Exception:
+                    self.failures += 1
+                    REFRESH_FAILURES.labels(name).inc()
+                    logger.exception('Dashboard refresh of %s failed', name)
+                    try:
+                        connection.rollback()
+                    except psycopg2.Error:
+                        #Heroku drops idle connections, throw this one away and get a fresh one next time
+                        broken = True
+                        return
+                    continue
+                self.results[name] = result
+                self.refreshed_at[name] = time.time()
+        finally:
+            self.release(connection, broken=broken)
+
+    def _run(self):
+        while True:
+            start = time.monotonic()
+            try:
+                with REFRESH_SECONDS.time():
+                    self.refresh()
+            except Exception:
+                #No connection could be had, every part keeps its previous result
+                self.failures += 1
+                for name in self.computes:
+                    REFRESH_FAILURES.labels(name).inc()
+                logger.exception('Dashboard refresh failed')
+            #The callbacks stop waiting once an attempt is over, they serve what there is
+            self._ready.set()
+            #Keep to the schedule whatever the time the refresh took
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
@@ -3,4 +3,24 @@ TABLE_NAME = "Facebook"
 TABLE_ATTRIBUTES = "tweet_id VARCHAR(255), created_at DATETIME, text VARCHAR(1000), \
             polarity INT, subjectivity INT, user_created_at DATETIME, user_location VARCHAR(255), \
             user_description VARCHAR(255), user_followers_count INT, longitude DOUBLE, latitude DOUBLE, \
-            retweet_count INT, like_count INT"
\ No newline at end of file
+            retweet_count INT, like_count INT"
+UTC_OFFSET_HOURS = -7 #the dashboard shows times in PDT (Pacific Daylight Time)
+REFRESH_INTERVAL = 10 #seconds between two updates of the dashboard
+#The dashboard keeps the tweets of the last STORE_WINDOW_HOURS in memory, at most STORE_MAX_ROWS of them
+STORE_WINDOW_HOURS = 24
+STORE_MAX_ROWS = 9600
+POOL_MAX_CONNECTIONS = 2 #connections per gunicorn worker
+#The new tweets and rollup buckets are read by the time the scraper wrote them (inserted_at, updated_at),
+#every refresh also re-reads the last STORE_LOOKBACK_SECONDS of them for the transactions that were still
+#being committed: keep it above the longest flush of the scraper
+STORE_LOOKBACK_SECONDS = 30
+#Rollups maintained by the scraper, the time series shows the last ROLLUP_WINDOW_HOURS of them
+ROLLUP_TABLE_NAME = "sentiment_rollup"
+DAILY_TABLE_NAME = "daily_rollup"
+ROLLUP_WINDOW_HOURS = 2
+#Sentiment engine of the "hot words" polarities: 'lexicon' (TextBlob's lexicon loaded once, same scores) or 'textblob'
+SENTIMENT_ENGINE = 'lexicon'
+#The time series gets at most SERIES_MAX_POINTS points (older ones are dropped by the browser, long gaps are
+#downsampled), the buckets of the last SERIES_SETTLE_SECONDS are still being filled and are sent later
+SERIES_MAX_POINTS = 720
+SERIES_SETTLE_SECONDS = 30
@@ -0,0 +1,189 @@
+#This file implements the in-process data stores shared by the dashboard callbacks:
+#1. Only the rows written since the last watermark are fetched from the database, by the time the scraper
+#   wrote them (inserted_at, updated_at) rather than created_at, as a backlog is written long after
+#2. Rows older than the window are dropped from memory
+#3. The per-polarity counts in 10 second buckets are read from the rollup maintained by the scraper
+#4. Every stage of a refresh is timed in STAGE_SECONDS, served on /metrics
+
+import datetime
+import threading
+import time
+
+import pandas as pd
+
+from geo import resolve_state
+from metrics import Histogram
+
+STAGE_SECONDS = Histogram('dashboard_stage_seconds', 'Seconds spent in each stage of refreshing the dashboard', ['stage'])
+
+COLUMNS = ['tweet_id', 'text', 'created_at', 'polarity', 'user_location', 'user_state']
+POLARITIES = [-1, 0, 1]
+
+class TweetStore:
+    '''
+    Recent tweets, refreshed incrementally.
+
+    created_at is shifted by utc_offset and the missing user_state are resolved once, when the
+    rows are fetched. The store keeps the tweets of the last window (a timedelta, None for no
+    limit), at most max_rows of them.
+    Every refresh reads the tweets inserted since the latest inserted_at seen, minus lookback
+    to pick up the transactions that were still being committed; duplicates are dropped by
+    tweet_id.
+
+    Every tracker is told about the tweets entering the window with add(tweets) and about
+    the ones leaving it with remove(tweets), so that it can maintain its aggregates.
+    '''
+    def __init__(self, table_name, utc_offset, window=None, max_rows=None,
+                 lookback=datetime.timedelta(seconds=30), trackers=()):
+        self.table_name = table_name
+        self.utc_offset = utc_offset
+        self.window = window
+        self.max_rows = max_rows
+        self.lookback = lookback
+        self.trackers = trackers
+        self.tweets = pd.DataFrame({column: pd.Series(dtype='datetime64[ns]' if column == 'created_at' else 'object')
+                                    for column in COLUMNS})
+        self.watermark = None #latest inserted_at seen, in UTC as stored in the database
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, connection):
+        '''
+        Fetch the new tweets and drop the expired ones
+        '''
+        with self._lock:
+            new = self._fetch(connection)
+            self._append(new)
+            self._expire()
+            self.refreshed_at = time.monotonic()
+
+    def snapshot(self):
+        '''
+        Return the current tweets, the frame must not be modified
+        '''
+        return self.tweets
+
+    def _fetch(self, connection):
+        query = f"SELECT {', '.join(COLUMNS)}, inserted_at FROM {self.table_name}"
+        if self.watermark is not None:
+            since = self.watermark - self.lookback
+            query += f" WHERE inserted_at >= '{since.strftime('%Y-%m-%d %H:%M:%S')}'"
+        elif self.window is not None:
+            since = datetime.datetime.utcnow() - self.window
+            query += f" WHERE created_at >= '{since.strftime('%Y-%m-%d %H:%M:%S')}'"
+        with STAGE_SECONDS.labels('query').time():
+            new = pd.read_sql(query, con=connection)
+        inserted_at = pd.to_datetime(new.pop('inserted_at'))
+        if new.empty:
+            return new
+        new['created_at'] = pd.to_datetime(new['created_at'])
+        if inserted_at.notna().any():
+            self.watermark = max(self.watermark or inserted_at.max(), inserted_at.max())
+        if not self.tweets.empty:
+            #Rows of the lookback that are already in the store
+            new = new[~new['tweet_id'].isin(self.tweets['tweet_id'])]
+        #Shift the timestamps once for every row (vectorized), instead of on every refresh
+        new['created_at'] = new['created_at'] + self.utc_offset
+        #The scraper resolves the US state at ingest, only the rows stored before it did are resolved here
+        missing = new['user_state'].isna() & new['user_location'].notna()
+        if missing.any():
+            with STAGE_SECONDS.labels('geo_match').time():
+                new.loc[missing, 'user_state'] = new.loc[missing, 'user_location'].map(resolve_state)
+        return new
+
+    def _append(self, new):
+        if new.empty:
+            return
+        self.tweets = pd.concat([self.tweets, new], ignore_index=True).sort_values('created_at', kind='stable', ignore_index=True)
+        with STAGE_SECONDS.labels('tokenize').time():
+            for tracker in self.trackers:
+                tracker.add(new)
+
+    def _expire(self):
+        if self.tweets.empty:
+            return
+        keep = pd.Series(True, index=self.tweets.index)
+        if self.window is not None:
+            keep &= self.tweets['created_at'] >= datetime.datetime.utcnow() + self.utc_offset - self.window
+        if self.max_rows is not None and len(self.tweets) > self.max_rows:
+            keep.iloc[:len(self.tweets) - self.max_rows] = False #the tweets are sorted by created_at
+        if not keep.all():
+            expired = self.tweets[~keep]
+            self.tweets = self.tweets[keep].reset_index(drop=True)
+            with STAGE_SECONDS.labels('tokenize').time():
+                for tracker in self.trackers:
+                    tracker.remove(expired)
+
+class RollupStore:
+    '''
+    Per-polarity tweet counts in 10 second buckets and today's totals, read from the rollup
+    tables the scraper maintains at ingest.
+
+    Buckets are shifted by utc_offset like the tweets. The scraper keeps adding to the buckets,
+    also to old ones when it works through a backlog: every refresh re-reads the buckets updated
+    since the latest updated_at seen (minus lookback, for the transactions that were still being
+    committed) and replaces them.
+    '''
+    def __init__(self, table_name, daily_table_name, utc_offset, window, freq='10s',
+                 lookback=datetime.timedelta(seconds=30)):
+        self.table_name = table_name
+        self.daily_table_name = daily_table_name
+        self.utc_offset = utc_offset
+        self.window = window
+        self.freq = freq
+        self.lookback = lookback
+        self.counts = pd.DataFrame(columns=POLARITIES, dtype='int64') #index: start of the bucket, columns: polarity
+        self.daily_tweets = 0
+        self.daily_impressions = 0
+        self.watermark = None #latest updated_at seen, in UTC as stored in the database
+        self._lock = threading.Lock()
+
+    def refresh(self, connection):
+        '''
+        Fetch the new and updated buckets, drop the expired ones and read today's totals
+        '''
+        with self._lock:
+            query = f"SELECT bucket, polarity, tweets, updated_at FROM {self.table_name}"
+            if self.watermark is not None:
+                #Every polarity of the updated buckets, as the buckets are replaced as a whole
+                since = self.watermark - self.lookback
+                query += (f" WHERE bucket IN (SELECT bucket FROM {self.table_name}"
+                          f" WHERE updated_at >= '{since.strftime('%Y-%m-%d %H:%M:%S')}')")
+            else:
+                since = datetime.datetime.utcnow() - self.window
+                query += f" WHERE bucket >= '{since.strftime('%Y-%m-%d %H:%M:%S')}'"
+            with STAGE_SECONDS.labels('query').time():
+                rows = pd.read_sql(query, con=connection)
+            updated_at = pd.to_datetime(rows.pop('updated_at'))
+            if updated_at.notna().any():
+                self.watermark = max(self.watermark or updated_at.max(), updated_at.max())
+            if not rows.empty:
+                rows['bucket'] = pd.to_datetime(rows['bucket'])
+                with STAGE_SECONDS.labels('resample').time():
+                    new = rows.pivot_table(index='bucket', columns='polarity', values='tweets', aggfunc='sum', fill_value=0)
+                    new = new.reindex(columns=POLARITIES, fill_value=0).astype('int64')
+                    new.index = new.index + self.utc_offset
+                    new.columns.name = None
+                    #The re-read buckets replace the ones in memory
+                    counts = self.counts[~self.counts.index.isin(new.index)]
+                    self.counts = pd.concat([counts, new]).sort_index()
+            start = datetime.datetime.utcnow() + self.utc_offset - self.window
+            self.counts = self.counts[self.counts.index >= start]
+
+            today = (datetime.datetime.utcnow() + self.utc_offset).strftime('%Y-%m-%d')
+            with STAGE_SECONDS.labels('query').time():
+                daily = pd.read_sql(f"SELECT tweets, impressions FROM {self.daily_table_name} WHERE day = '{today}'", con=connection)
+            self.daily_tweets = int(daily['tweets'].iloc[0]) if not daily.empty else 0
+            self.daily_impressions = int(daily['impressions'].iloc[0]) if not daily.empty else 0
+
+    def snapshot(self):
+        '''
+        Return the counts with every bucket between the first and the last one, and today's
+        number of tweets and potential impressions; the frame must not be modified
+        '''
+        counts = self.counts
+        if not counts.empty:
+            with STAGE_SECONDS.labels('resample').time():
+                buckets = pd.date_range(counts.index.min(), counts.index.max(), freq=self.freq)
+                counts = counts.reindex(buckets, fill_value=0)
+        return counts, self.daily_tweets, self.daily_impressions
@@ -0,0 +1,69 @@
+#This file keeps the word frequencies of the "hot words" chart up to date incrementally:
+#1. Every tweet is tokenized once, when it enters the window of the TweetStore
+#2. Its words are counted in, and counted out again when the tweet leaves the window
+#3. The polarity of every word is looked up once and memoized
+
+import settings #Import the related setting constants from settings.py
+
+import re
+from collections import Counter
+from functools import lru_cache
+
+from nltk.corpus import stopwords
+
+from sentiment import get_scorer
+
+_URL = re.compile(r"http\S+")
+_NON_ALPHANUMERIC = re.compile('[^A-Za-z0-9]+')
+
+_score = get_scorer(settings.SENTIMENT_ENGINE)
+
+@lru_cache(maxsize=16384)
+def word_polarity(word):
+    '''
+    Polarity of a single word, memoized as the hot words barely change between refreshes
+    '''
+    return _score(word)[0]
+
+class WordCounter:
+    '''
+    Exact counts of the words of the tweets currently in the window.
+
+    Pass it to the TweetStore, which calls add() with the new tweets and remove() with the
+    expired ones. Words are lower-cased, stop words and words shorter than min_length are
+    left out.
+    '''
+    def __init__(self, min_length=3):
+        self.min_length = min_length
+        self.stop_words = set(stopwords.words("english"))
+        self.counts = Counter()
+        self._top = {}
+
+    def tokenize(self, text):
+        '''
+        Clean and split the text of a tweet into the counted words
+        '''
+        text = _URL.sub("", text)
+        text = text.replace('RT ', ' ').replace('&amp;', 'and')
+        text = _NON_ALPHANUMERIC.sub(' ', text).lower()
+        return [word for word in text.split() if len(word) >= self.min_length and word not in self.stop_words]
+
+    def add(self, tweets):
+        for text in tweets['text'].dropna():
+            self.counts.update(self.tokenize(text))
+        self._top = {}
+
+    def remove(self, tweets):
+        for text in tweets['text'].dropna():
+            self.counts.subtract(self.tokenize(text))
+        #Forget the words that are no longer in the window, so that the vocabulary stays bounded
+        self.counts = +self.counts
+        self._top = {}
+
+    def most_common(self, n):
+        '''
+        The n most frequent words and their counts, computed once per change of the window
+        '''
+        if n not in self._top:
+            self._top[n] = self.counts.most_common(n)
+        return self._top[n]
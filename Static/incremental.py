@@ -0,0 +1,173 @@
+#This file trains a classifier that can keep learning, out of core, instead of refitting the SVC on everything:
+#1. Texts are turned into features by a stateless HashingVectorizer, so no vocabulary has to be kept in memory
+#2. A linear model learns from batches with partial_fit, e.g. chunks of a training CSV streamed from disk
+#   or labelled tweets as they arrive
+#3. Running the file benchmarks it against the SVC, MultinomialNB and DecisionTree of the notebook
+#
+#Usage: python incremental.py train [--csv training.csv] [--chunk-size 1000] [--epochs 5]
+#       python incremental.py benchmark [--csv training.csv] [--test-size 0.2]
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+
+from model import MODELS_DIR, TRAINING_CSV, VECTORIZER_PARAMS, classes
+from preprocessing import clean_tweet, clean_tweets
+
+ARTIFACT_PATH = os.path.join(MODELS_DIR, 'incremental_classifier.joblib')
+N_FEATURES = 2 ** 18 #hashed features, collisions are rare at this size for the vocabulary of tweets
+CHUNK_SIZE = 1000 #rows of the CSV read, cleaned and learnt from at once
+
+def encode_labels(labels):
+    '''
+    Index in classes of every 'positive', 'negative' or 'neutral' label
+    '''
+    return pd.Series(labels).map({label: i for i, label in enumerate(classes)}).to_numpy(dtype='int')
+
+def iter_chunks(csv_path, chunk_size=CHUNK_SIZE):
+    '''
+    Yield the cleaned texts and the encoded labels of csv_path, chunk_size rows at a time,
+    so that only one chunk is in memory
+    '''
+    for chunk in pd.read_csv(csv_path, usecols=['text', 'airline_sentiment'], chunksize=chunk_size):
+        #Cleaned in this process, which keeps its lemma cache from one chunk to the next, and not
+        #cached on disk, where a file per chunk would pile up for as long as chunks keep coming
+        yield clean_tweets(chunk['text'], processes=1, cache_dir=None), encode_labels(chunk['airline_sentiment'])
+
+class IncrementalClassifier:
+    '''
+    Hashed bag of words + linear SVM trained with stochastic gradient descent.
+
+    partial_fit() can be called any number of times, with texts already cleaned by clean_review
+    (cleaned=True) or raw ones. The vectorizer has no state, so the model is all there is to save.
+    '''
+    def __init__(self, n_features=N_FEATURES, alpha=1e-5):
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm='l2')
+        self.model = SGDClassifier(loss='hinge', alpha=alpha, random_state=0)
+        self.seen = 0
+
+    def _features(self, texts, cleaned):
+        if not cleaned:
+            texts = [clean_tweet(text) for text in texts]
+        return self.vectorizer.transform(texts)
+
+    def partial_fit(self, texts, labels, cleaned=False):
+        '''
+        Learn from a batch of texts and their encoded labels
+        '''
+        self.model.partial_fit(self._features(texts, cleaned), labels, classes=np.arange(len(classes)))
+        self.seen += len(labels)
+        return self
+
+    def predict_indices(self, texts, cleaned=False):
+        return self.model.predict(self._features(texts, cleaned))
+
+    def predict(self, texts, cleaned=False):
+        '''
+        Predicted class ('positive', 'negative' or 'neutral') of every text
+        '''
+        return np.asarray(classes)[self.predict_indices(texts, cleaned)].tolist()
+
+    def save(self, path=ARTIFACT_PATH):
+        #A plain dict rather than the instance, which would be pickled as __main__.IncrementalClassifier
+        #when trained by running this file and could not be loaded from anywhere else
+        artifact = {'n_features': self.vectorizer.n_features, 'model': self.model, 'seen': self.seen}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(artifact, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path=ARTIFACT_PATH):
+        artifact = joblib.load(path)
+        classifier = IncrementalClassifier(n_features=artifact['n_features'])
+        classifier.model = artifact['model']
+        classifier.seen = artifact['seen']
+        return classifier
+
+def train_streaming(csv_path=TRAINING_CSV, chunk_size=CHUNK_SIZE, epochs=5, classifier=None):
+    '''
+    Train classifier (a new one by default) on csv_path, streamed chunk_size rows at a time,
+    epochs passes over the file
+    '''
+    classifier = classifier or IncrementalClassifier()
+    for _ in range(epochs):
+        for texts, labels in iter_chunks(csv_path, chunk_size):
+            classifier.partial_fit(texts, labels, cleaned=True)
+    return classifier
+
+def _measure(fit):
+    #Seconds and peak traced allocations (numpy and Python, not the C heap of libsvm) of fit(),
+    #from two runs as tracing the allocations slows down the pure Python parts
+    start = time.perf_counter()
+    fit()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    model = fit()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return model, seconds, peak / 1024 / 1024
+
+def benchmark(csv_path=TRAINING_CSV, test_size=0.2, chunk_size=CHUNK_SIZE, epochs=5):
+    '''
+    Fit time, peak memory and held-out accuracy of the notebook's classifiers and of the
+    incremental one. The tweets are cleaned once beforehand (and cached), so only the
+    vectorizing and the fitting are timed.
+    '''
+    data = pd.read_csv(csv_path, usecols=['text', 'airline_sentiment'])
+    texts = clean_tweets(data['text'])
+    labels = encode_labels(data['airline_sentiment'])
+    train_texts, test_texts, train_labels, test_labels = train_test_split(texts, labels, test_size=test_size, random_state=0, stratify=labels)
+
+    report = {}
+    for name, estimator in (('svc', SVC), ('mnb', MultinomialNB), ('decision_tree', DecisionTreeClassifier)):
+        def fit():
+            vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+            return vectorizer, estimator().fit(vectorizer.fit_transform(train_texts), train_labels)
+        (vectorizer, model), seconds, peak_mb = _measure(fit)
+        accuracy = float((model.predict(vectorizer.transform(test_texts)) == test_labels).mean())
+        report[name] = {'fit_seconds': seconds, 'peak_mb': peak_mb, 'accuracy': accuracy}
+
+    def fit():
+        classifier = IncrementalClassifier()
+        for _ in range(epochs):
+            for start in range(0, len(train_texts), chunk_size):
+                classifier.partial_fit(train_texts[start:start + chunk_size], train_labels[start:start + chunk_size], cleaned=True)
+        return classifier
+    classifier, seconds, peak_mb = _measure(fit)
+    accuracy = float((classifier.predict_indices(test_texts, cleaned=True) == test_labels).mean())
+    report['incremental'] = {'fit_seconds': seconds, 'peak_mb': peak_mb, 'accuracy': accuracy}
+    report['rows'] = {'train': len(train_texts), 'test': len(test_texts)}
+    return report
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Train or benchmark the incremental tweet classifier')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='train the classifier on a CSV streamed in chunks, continuing from the saved one if any')
+    train_parser.add_argument('--csv', default=TRAINING_CSV, help='labelled tweets')
+    train_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    train_parser.add_argument('--epochs', type=int, default=5)
+    train_parser.add_argument('--fresh', action='store_true', help='start from a new classifier instead of the saved one')
+    benchmark_parser = subparsers.add_parser('benchmark', help='compare with the classifiers of the notebook')
+    benchmark_parser.add_argument('--csv', default=TRAINING_CSV, help='labelled tweets, split into a training and a test set')
+    benchmark_parser.add_argument('--test-size', type=float, default=0.2)
+    args = arg_parser.parse_args()
+
+    if args.command == 'train':
+        classifier = None if args.fresh or not os.path.exists(ARTIFACT_PATH) else IncrementalClassifier.load()
+        classifier = train_streaming(args.csv, args.chunk_size, args.epochs, classifier)
+        classifier.save()
+        print(f'{ARTIFACT_PATH}: trained on {classifier.seen} tweets')
+    else:
+        print(json.dumps(benchmark(args.csv, args.test_size), indent=2))
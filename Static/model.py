@@ -0,0 +1,164 @@
+#This file trains the TF-IDF + SVC classifier of TwitterSentimentAnalysis.ipynb once and serves it from then on:
+#1. train() cleans the training tweets, fits the vectorizer and the model and saves them as a versioned artifact
+#2. TweetClassifier loads an artifact once, memory-mapping its arrays, and classifies batches of raw texts
+#3. Running the file trains a new artifact, or benchmarks the latest one
+#
+#Usage: python model.py train [--csv training.csv]
+#       python model.py benchmark [--artifact models/tweet_classifier-v1.joblib] [--batch-size 100] [--batches 200]
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.svm import SVC
+
+import preprocessing
+from preprocessing import clean_tweet, clean_tweets
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+TRAINING_CSV = os.path.join(DIRECTORY, 'training_twitter_x_y_train.csv')
+TEST_CSV = os.path.join(DIRECTORY, 'test_twitter_x_test.csv')
+MODELS_DIR = os.path.join(DIRECTORY, 'models')
+ARTIFACT_FORMAT = 1 #bump when the content of the artifacts changes
+
+classes = ['positive', 'negative', 'neutral']
+
+#Same vectorizer as in the notebook
+VECTORIZER_PARAMS = dict(max_features=5000, max_df=1, min_df=1, ngram_range=(1, 1))
+
+_ARTIFACT_NAME = re.compile(r'tweet_classifier-v(\d+)\.joblib$')
+
+def artifact_versions(models_dir=MODELS_DIR):
+    '''
+    Versions of the artifacts in models_dir, sorted
+    '''
+    paths = glob.glob(os.path.join(models_dir, 'tweet_classifier-v*.joblib'))
+    return sorted(int(_ARTIFACT_NAME.search(path).group(1)) for path in paths if _ARTIFACT_NAME.search(path))
+
+def artifact_path(version, models_dir=MODELS_DIR):
+    return os.path.join(models_dir, f'tweet_classifier-v{version}.joblib')
+
+def latest_artifact(models_dir=MODELS_DIR):
+    '''
+    Path of the latest artifact in models_dir
+    '''
+    versions = artifact_versions(models_dir)
+    if not versions:
+        raise FileNotFoundError(f'No trained classifier in {models_dir}, run python model.py train first')
+    return artifact_path(versions[-1], models_dir)
+
+def train(csv_path=TRAINING_CSV, models_dir=MODELS_DIR):
+    '''
+    Fit the vectorizer and the SVC on the tweets of csv_path and save them as the next
+    version of the artifact in models_dir. Return the path of the artifact.
+    '''
+    train_data = pd.read_csv(csv_path)
+    training_tweets = clean_tweets(train_data['text'])
+    Y_train = train_data['airline_sentiment'].map({label: i for i, label in enumerate(classes)}).to_numpy(dtype='int')
+
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
+    X_train_transformed = vectorizer.fit_transform(training_tweets)
+    model = SVC()
+    model.fit(X_train_transformed, Y_train)
+
+    versions = artifact_versions(models_dir)
+    version = versions[-1] + 1 if versions else 1
+    artifact = {'format': ARTIFACT_FORMAT,
+                'version': version,
+                'trained_at': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+                'training_rows': len(train_data),
+                'train_accuracy': model.score(X_train_transformed, Y_train),
+                'cleaning_version': preprocessing.CACHE_VERSION,
+                'sklearn_version': sklearn.__version__,
+                'classes': classes,
+                'vectorizer': vectorizer,
+                'model': model}
+    os.makedirs(models_dir, exist_ok=True)
+    path = artifact_path(version, models_dir)
+    #Not compressed, so that the arrays can be memory-mapped when loading
+    joblib.dump(artifact, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+class TweetClassifier:
+    '''
+    A trained artifact, loaded once.
+
+    The numpy arrays of the model (support vectors, coefficients, idf) are memory-mapped
+    read-only, so loading is fast and the pages are shared by the processes using the same
+    artifact. Texts are cleaned with the same clean_review as the training tweets.
+    '''
+    def __init__(self, path=None, mmap=True):
+        self.path = path or latest_artifact()
+        start = time.perf_counter()
+        artifact = joblib.load(self.path, mmap_mode='r' if mmap else None)
+        self.load_seconds = time.perf_counter() - start
+        if artifact['format'] != ARTIFACT_FORMAT:
+            raise ValueError(f"{self.path} has format {artifact['format']}, expected {ARTIFACT_FORMAT}, train it again")
+        if artifact['cleaning_version'] != preprocessing.CACHE_VERSION:
+            raise ValueError(f"{self.path} was trained on tweets cleaned differently (version {artifact['cleaning_version']}), train it again")
+        self.version = artifact['version']
+        self.classes = np.asarray(artifact['classes'])
+        self.vectorizer = artifact['vectorizer']
+        self.model = artifact['model']
+
+    def predict_indices(self, texts):
+        '''
+        Index in classes of the predicted class of every text
+        '''
+        cleaned = [clean_tweet(text) for text in texts]
+        if not cleaned:
+            return np.empty(0, dtype='int')
+        return self.model.predict(self.vectorizer.transform(cleaned))
+
+    def predict(self, texts):
+        '''
+        Predicted class ('positive', 'negative' or 'neutral') of every text
+        '''
+        return self.classes[self.predict_indices(texts)].tolist()
+
+def benchmark(path=None, batch_size=100, batches=200, csv_path=TEST_CSV):
+    '''
+    Load time of the artifact and latency percentiles of classifying batches of batch_size tweets
+    '''
+    classifier = TweetClassifier(path)
+    texts = pd.read_csv(csv_path)['text'].tolist()
+    latencies = []
+    for i in range(batches):
+        start = (i * batch_size) % max(1, len(texts) - batch_size)
+        batch = texts[start:start + batch_size]
+        began = time.perf_counter()
+        classifier.predict(batch)
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    return {'artifact': classifier.path,
+            'load_ms': classifier.load_seconds * 1000,
+            'batch_size': batch_size,
+            'batches': batches,
+            'latency_ms': {f'p{p}': latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000 for p in (50, 95, 99)},
+            'tweets_per_sec': batch_size * batches / sum(latencies)}
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Train or benchmark the tweet classifier')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='train a new version of the classifier')
+    train_parser.add_argument('--csv', default=TRAINING_CSV, help='labelled tweets')
+    benchmark_parser = subparsers.add_parser('benchmark', help='measure the load time and the batch latency')
+    benchmark_parser.add_argument('--artifact', default=None, help='artifact to load, the latest one by default')
+    benchmark_parser.add_argument('--batch-size', type=int, default=100)
+    benchmark_parser.add_argument('--batches', type=int, default=200)
+    args = arg_parser.parse_args()
+
+    if args.command == 'train':
+        print(train(args.csv))
+    else:
+        print(json.dumps(benchmark(args.artifact, args.batch_size, args.batches), indent=2))
@@ -0,0 +1,128 @@
+#This file cleans the tweets for the classifier of TwitterSentimentAnalysis.ipynb:
+#1. Strips the punctuation with translation tables compiled once, at import
+#2. POS-tags every tweet with a single pos_tag call and memoizes the lemma of every (word, tag)
+#3. Fans the tweets out over a pool of processes, in chunks
+#4. Keeps the cleaned tweets in an on-disk cache keyed by a hash of the input, so that reruns skip the work
+#
+#Usage (from the notebook): from preprocessing import clean_tweets; training_tweets = clean_tweets(X_train)
+
+import hashlib
+import json
+import os
+import string
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from nltk import pos_tag
+from nltk.corpus import stopwords, wordnet
+from nltk.stem import WordNetLemmatizer
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+#Bump when the cleaning changes, so that the cached tweets are not reused
+CACHE_VERSION = 1
+CHUNK_SIZE = 256 #tweets sent to a worker process at once
+LEMMA_CACHE_SIZE = 65536 #distinct (word, tag) remembered by lemmatize
+
+#" ' " appears in a lot of words and would change the meaning of the words if removed,
+#hence it is not one of the removed punctuations; "\t" in a word becomes none as well
+_PUNCTUATION_TABLE = str.maketrans('', '', '\t' + string.punctuation.replace("'", ""))
+
+stop_words = set(stopwords.words('english'))
+stop_words.update(string.punctuation)
+
+lemmatizer = WordNetLemmatizer()
+
+def get_simple_pos_tag(nltk_pos_tag):
+    '''
+    Map a Penn Treebank tag to the WordNet part of speech used by the lemmatizer
+    '''
+    if nltk_pos_tag.startswith('J'):
+        return wordnet.ADJ
+    elif nltk_pos_tag.startswith('V'):
+        return wordnet.VERB
+    elif nltk_pos_tag.startswith('R'):
+        return wordnet.ADV
+    else:
+        return wordnet.NOUN
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word, tag):
+    '''
+    Lower-cased lemma of word, given its Penn Treebank tag
+    '''
+    return lemmatizer.lemmatize(word, pos=get_simple_pos_tag(tag)).lower()
+
+def preprocess(words_list):
+    '''
+    Remove the punctuation, quotes, numbers and words with two or less characters from words_list
+    '''
+    words_list = [word.translate(_PUNCTUATION_TABLE) for word in words_list]
+    words = []
+    for word in words_list:
+        if not word:
+            continue
+        #some words are quoted in the documents and as we have not removed " ' " to maintain
+        #the meaning of the words, we try to unquote such words below
+        if word[0] == "'":
+            word = word[1:-1] if word[-1] == "'" else word[1:]
+        #we will also remove just numeric strings as they do not have any significant meaning in
+        #text classification, and words with two or less characters
+        if len(word) > 2 and not word.isdigit():
+            words.append(word)
+    return words
+
+def clean_review(word_list):
+    '''
+    Lemmatized, lower-cased words of a tweet split on spaces, without the stop words
+    '''
+    words = preprocess(word_list)
+    if not words:
+        return []
+    #Tagging the whole tweet at once, which is much faster than a call per word and gives the tagger its context
+    return [lemmatize(word, tag) for word, tag in pos_tag(words) if word.lower() not in stop_words]
+
+def clean_tweet(tweet):
+    '''
+    Cleaned tweet, as a single string
+    '''
+    return " ".join(clean_review(tweet.split(' ')))
+
+def input_hash(tweets):
+    '''
+    Key of the cleaned tweets in the cache: a hash of the tweets and of the cleaning version
+    '''
+    digest = hashlib.sha256(f'v{CACHE_VERSION}'.encode('utf-8'))
+    for tweet in tweets:
+        digest.update(b'\0')
+        digest.update(tweet.encode('utf-8'))
+    return digest.hexdigest()
+
+def clean_tweets(tweets, processes=None, chunk_size=CHUNK_SIZE, cache_dir=CACHE_DIR):
+    '''
+    Cleaned tweets, in the same order.
+
+    The tweets are cleaned by processes worker processes (None for one per CPU, 1 to clean them
+    in this process), chunk_size at a time. The result is saved in cache_dir (None not to
+    cache it) and read back from there the next time the same tweets are cleaned.
+    '''
+    tweets = list(tweets)
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f'{input_hash(tweets)}.json')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+
+    if processes == 1 or len(tweets) <= chunk_size:
+        cleaned = [clean_tweet(tweet) for tweet in tweets]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            cleaned = list(executor.map(clean_tweet, tweets, chunksize=chunk_size))
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        #Written to a temporary file first, so that an interrupted run doesn't leave a truncated cache behind
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(cleaned, f)
+        os.replace(path + '.tmp', path)
+    return cleaned